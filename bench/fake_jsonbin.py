@@ -0,0 +1,159 @@
+"""
+Local stand-in for the JSONBin v3 bin API (GET/PUT /v3/b/<id>).
+
+Keeps one record in memory, answers If-None-Match with 304, and can
+add latency and a requests-per-second limit (429 above it) so the
+storage layer sees the same failure modes as the real service.
+
+    python bench/fake_jsonbin.py --port 8081 --latency 150 --rate 10
+"""
+import os
+import sys
+import copy
+import json
+import math
+import time
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import TokenBucket  # noqa: E402
+
+
+class FakeJsonBin:
+    def __init__(self, record=None, latency=0.0, rate=0.0, bin_id="bench"):
+        self.bin_id = bin_id
+        self.latency = latency      # ثانیه، برای هر درخواست
+        self.rate = rate            # درخواست در ثانیه؛ 0 یعنی بدون محدودیت
+        self.calls = Counter()      # GET / PUT / 304 / 429
+        self._lock = threading.Lock()
+        self._server = None
+        self.reset(record or {})
+
+    # --------------------------------------------
+    # state
+    # --------------------------------------------
+    def reset(self, record):
+        with self._lock:
+            self.record = copy.deepcopy(record)
+            self.revision = 1
+            self.calls.clear()
+            self._bucket = TokenBucket(self.rate, max(1.0, self.rate)) if self.rate else None
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self.record)
+
+    def _etag(self):
+        return f'"{self.revision}"'
+
+    def _admit(self):
+        with self._lock:
+            return self._bucket is None or self._bucket.try_acquire()
+
+    def _retry_after(self):
+        """Whole seconds until a token is free, as a Retry-After header."""
+        with self._lock:
+            return max(1, math.ceil(self._bucket.delay()))
+
+    # --------------------------------------------
+    # server
+    # --------------------------------------------
+    def start(self, host="127.0.0.1", port=0):
+        """Serve in a daemon thread; returns the API base URL (…/v3)."""
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=None, etag=None, retry_after=None):
+            payload = b"" if body is None else json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if etag:
+                self.send_header("ETag", etag)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _check(self):
+            if self.path.rstrip("/") != f"/v3/b/{fake.bin_id}":
+                self._send(404, {"message": "Bin not found"})
+                return False
+            if not self.headers.get("X-Master-Key"):
+                self._send(401, {"message": "X-Master-Key missing"})
+                return False
+            if fake.latency:
+                time.sleep(fake.latency)
+            if not fake._admit():
+                fake.calls["429"] += 1
+                self._send(429, {"message": "Too many requests"},
+                           retry_after=fake._retry_after())
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._check():
+                return
+            fake.calls["GET"] += 1
+            with fake._lock:
+                etag = fake._etag()
+                if self.headers.get("If-None-Match") == etag:
+                    fake.calls["304"] += 1
+                    self._send(304, etag=etag)
+                    return
+                body = {"record": copy.deepcopy(fake.record),
+                        "metadata": {"id": fake.bin_id, "private": True}}
+            self._send(200, body, etag)
+
+        def do_PUT(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            if not self._check():
+                return
+            fake.calls["PUT"] += 1
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                self._send(400, {"message": "Invalid JSON"})
+                return
+            with fake._lock:
+                fake.record = record
+                fake.revision += 1
+                etag = fake._etag()
+            self._send(200, {"record": record,
+                             "metadata": {"parentId": fake.bin_id, "private": True}}, etag)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="ms per request")
+    parser.add_argument("--rate", type=float, default=0, help="requests/s (0 = unlimited)")
+    parser.add_argument("--bin-id", default="bench")
+    args = parser.parse_args()
+
+    fake = FakeJsonBin(latency=args.latency / 1000, rate=args.rate, bin_id=args.bin_id)
+    print(f"Fake JSONBin at {fake.start(port=args.port)}/b/{args.bin_id}")
+    threading.Event().wait()
@@ -0,0 +1,98 @@
+"""
+Minimal Telegram Bot API stand-in for benchmarks.
+
+Answers the methods the bot uses (getMe, webhook setup, sendMessage,
+editMessageText, answerCallbackQuery) and hands every outgoing message
+to a callback so the load generator can react to the bot's replies.
+Point the bot at it with TELEGRAM_BASE_URL.
+"""
+import json
+import time
+import threading
+import itertools
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, on_message=None):
+        self.on_message = on_message  # callback(chat_id, text, reply_markup)
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve in a daemon thread; returns the value for TELEGRAM_BASE_URL."""
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _message(self, params):
+        chat_id = int(params["chat_id"])
+        markup = params.get("reply_markup")
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        text = params.get("text", "")
+
+        if self.on_message is not None:
+            self.on_message(chat_id, text, markup)
+
+        return {
+            "message_id": int(params.get("message_id") or next(self._ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    def call(self, method, params):
+        self.calls += 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        # setWebhook, deleteWebhook, answerCallbackQuery, ...
+        return True
+
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length).decode()
+
+            # PTB فرم یا JSON می‌فرستد؛ مقادیر تو در تو به‌صورت رشته JSON هستند
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(raw or "{}")
+            else:
+                params = {k: v[0] for k, v in parse_qs(raw).items()}
+
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            body = json.dumps({"ok": True, "result": fake.call(method, params)}).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+    return Handler
@@ -0,0 +1,411 @@
+"""
+Load test for the /reserve conversation against local stand-ins.
+
+Starts bench/fake_jsonbin.py and bench/fake_telegram.py, imports the
+bot (main.py) against them and, for each concurrency level, lets N
+synthetic users walk /reserve → name → day → slot through the ASGI
+webhook (and so through UpdateQueue and application.process_update).
+Users pick from the keyboards the bot actually shows, so concurrent
+users collide on the same slots.
+
+Reported per level: updates/sec, reply latency percentiles, JSONBin
+calls per booking, and double-booking / lost-update counts checked
+against the final bin contents.
+
+With --instances N > 1 each level starts N separate bot processes
+(python main.py, ASGI on its own port) sharing the same stand-ins and
+SQLite file, and users are spread over them. This is the cross-process
+case: lost_updates counts acknowledged bookings another instance
+overwrote (try it with and without JSONBIN_VERIFY_WRITES=1).
+
+The journal (JOURNAL_PATH) is off unless --journal is given; then every
+instance gets its own journal and snapshot in a temp directory, wiped
+before each level. Bookings that lose their cell when an instance
+rebases its journal onto JSONBin show up as lost_updates.
+
+    python bench/run.py --levels 1,10,50,200 --latency 150 --rate 10
+    python bench/run.py --levels 10,50 --instances 2
+    python bench/run.py --levels 10,50 --instances 2 --journal
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import tempfile
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_jsonbin import FakeJsonBin  # noqa: E402
+from fake_telegram import FakeTelegram  # noqa: E402
+from updates import UpdateFactory, keyboard_choices  # noqa: E402
+
+REPLY_TIMEOUT = 30.0
+READY_TIMEOUT = 30.0
+
+
+# ------------------------------------------------
+# Helpers
+# ------------------------------------------------
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Inbox:
+    """Bot replies per chat, delivered from the fake Telegram thread."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queues = defaultdict(asyncio.Queue)
+
+    def on_message(self, chat_id, text, markup):
+        self.loop.call_soon_threadsafe(self.queues[chat_id].put_nowait, (text, markup))
+
+    async def next(self, chat_id):
+        return await asyncio.wait_for(self.queues[chat_id].get(), REPLY_TIMEOUT)
+
+
+# ------------------------------------------------
+# One synthetic user
+# ------------------------------------------------
+async def user_session(uid, ctx, stats):
+    """Walk the conversation; returns (day, slot) if the bot confirmed it."""
+    inbox, factory = ctx["inbox"], ctx["factory"]
+    client = ctx["client_for"](uid)
+
+    async def say(payload):
+        while True:
+            t0 = time.perf_counter()
+            r = await client.post(ctx["webhook_path"], json=payload)
+            stats["updates"] += 1
+            if r.status_code == 503:
+                # مثل تلگرام: کمی بعد همان update دوباره ارسال می‌شود
+                stats["rejected"] += 1
+                await asyncio.sleep(float(r.headers.get("Retry-After", "1")) / 10)
+                continue
+            text, markup = await inbox.next(uid)
+            stats["latency"].append(time.perf_counter() - t0)
+            return text, markup
+
+    try:
+        await say(factory.message(uid, "/reserve"))
+        _, markup = await say(factory.message(uid, f"user {uid}"))
+
+        days = keyboard_choices(markup)
+        if not days:
+            return None
+        day = random.choice(days)
+
+        _, markup = await say(factory.message(uid, day))
+        slots = keyboard_choices(markup)
+        if not slots:
+            return None
+        label = random.choice(slots)
+
+        text, _ = await say(factory.message(uid, label))
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        return None
+
+    if text == ctx["msg_reserved"]:
+        return day, ctx["booking"].SLOT_LABELS.index(label)
+    return None
+
+
+# ------------------------------------------------
+# One concurrency level
+# ------------------------------------------------
+async def run_level(users, ctx):
+    fake, booking = ctx["fake"], ctx["booking"]
+
+    fake.reset(booking.empty_week())
+    await ctx["begin_level"]()
+
+    base = ctx["next_uid"]
+    ctx["next_uid"] += users
+    stats = {"updates": 0, "rejected": 0, "timeouts": 0, "latency": []}
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(
+        *[user_session(base + i, ctx, stats) for i in range(users)]
+    )
+    elapsed = time.perf_counter() - t0
+
+    # نوشتن‌های در صف تمام شوند
+    await asyncio.sleep(0.2)
+    await ctx["end_level"]()
+
+    acked = [(base + i, r) for i, r in enumerate(results) if r is not None]
+    owners = defaultdict(list)
+    for uid, cell in acked:
+        owners[cell].append(uid)
+
+    final = await ctx["load_final"]()
+    lost = 0
+    for uid, (day, slot) in acked:
+        cell = (final.get(day) or [False] * booking.CAPACITY)[slot]
+        if not isinstance(cell, dict) or cell.get("id") != uid:
+            lost += 1
+
+    calls = dict(fake.calls)
+    storage_calls = calls.get("GET", 0) + calls.get("PUT", 0)
+    lat_ms = [x * 1000 for x in stats["latency"]]
+
+    return {
+        "users": users,
+        "instances": ctx["instances"],
+        "updates": stats["updates"],
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(stats["updates"] / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(lat_ms, 0.5), 1),
+        "p95_ms": round(percentile(lat_ms, 0.95), 1),
+        "p99_ms": round(percentile(lat_ms, 0.99), 1),
+        "bookings": len(acked),
+        "jsonbin_calls": calls,
+        "calls_per_booking": round(storage_calls / len(acked), 2) if acked else None,
+        "double_bookings": sum(len(u) - 1 for u in owners.values() if len(u) > 1),
+        "lost_updates": lost,
+        "rejected_503": stats["rejected"],
+        "timeouts": stats["timeouts"],
+    }
+
+
+# ------------------------------------------------
+# Main
+# ------------------------------------------------
+def print_table(rows):
+    cols = ["users", "instances", "updates_per_sec", "p50_ms", "p95_ms", "p99_ms", "bookings",
+            "calls_per_booking", "double_bookings", "lost_updates", "rejected_503", "timeouts"]
+    print(" | ".join(f"{c:>15}" for c in cols))
+    for row in rows:
+        print(" | ".join(f"{str(row[c]):>15}" for c in cols))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Instances:
+    """N bot processes (python main.py in ASGI mode) sharing the stand-ins."""
+
+    def __init__(self, count, env, journal_dir=None):
+        self.count = count
+        self.env = env
+        self.journal_dir = journal_dir
+        self.procs = []
+        self.clients = []
+
+    async def start(self):
+        import httpx
+
+        if self.journal_dir:
+            # هر سطح با ژورنال خالی شروع می‌شود، مثل bin خالی
+            shutil.rmtree(self.journal_dir, ignore_errors=True)
+            os.makedirs(self.journal_dir)
+
+        for i in range(self.count):
+            port = free_port()
+            env = dict(self.env, PORT=str(port), REMINDERS_PATH=os.path.join(
+                tempfile.gettempdir(), f"bench_reminders_{i}.json"))
+            if self.journal_dir:
+                env.update(
+                    JOURNAL_PATH=os.path.join(self.journal_dir, f"journal_{i}.jsonl"),
+                    SNAPSHOT_PATH=os.path.join(self.journal_dir, f"snapshot_{i}.json"),
+                )
+            log = open(os.path.join(tempfile.gettempdir(), f"bench_instance_{i}.log"), "w")
+            self.procs.append(subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "main.py")],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+            ))
+            self.clients.append(httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}"))
+
+        deadline = time.monotonic() + READY_TIMEOUT
+        for proc, client in zip(self.procs, self.clients):
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"bot instance exited with {proc.returncode}")
+                try:
+                    if (await client.get("/")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("bot instance did not start")
+                await asyncio.sleep(0.2)
+
+    async def stop(self):
+        for client in self.clients:
+            await client.aclose()
+        # SIGTERM: uvicorn lifespan → shutdown() صف و نوشتن‌ها را تمام می‌کند
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                await asyncio.to_thread(proc.wait, 15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.procs, self.clients = [], []
+
+    def client_for(self, uid):
+        return self.clients[uid % len(self.clients)]
+
+
+async def bench(args):
+    loop = asyncio.get_running_loop()
+    inbox = Inbox(loop)
+
+    fake = FakeJsonBin(latency=args.latency / 1000, rate=args.rate)
+    tg = FakeTelegram(on_message=inbox.on_message)
+
+    sqlite_path = os.path.join(ROOT, "bench.db")
+    journal_dir = tempfile.mkdtemp(prefix="bench_journal_") if args.journal else None
+    os.environ.update({
+        "TOKEN": "123456:bench",
+        "RENDER_EXTERNAL_URL": "http://bench.invalid",
+        "WEBHOOK_MODE": "asgi",
+        "STORAGE_BACKEND": args.backend,
+        "JSONBIN_KEY": "bench",
+        "JSONBIN_ID": fake.bin_id,
+        "JSONBIN_API": fake.start(),
+        "TELEGRAM_BASE_URL": tg.start(),
+        "SQLITE_PATH": sqlite_path,
+        "JOURNAL_PATH": os.path.join(journal_dir, "journal.jsonl") if journal_dir else "",
+        "SNAPSHOT_PATH": os.path.join(journal_dir, "snapshot.json") if journal_dir else "",
+        "REMINDERS_PATH": os.path.join(tempfile.gettempdir(), "bench_reminders.json"),
+    })
+    fake.reset({})  # تا پیش از اولین سطح
+
+    import httpx
+    import booking
+
+    ctx = {
+        "fake": fake, "inbox": inbox, "booking": booking,
+        "factory": UpdateFactory(), "next_uid": 1000,
+        "msg_reserved": booking.MSG_RESERVED,
+        "webhook_path": f"/{os.environ['TOKEN']}",
+        "instances": args.instances,
+    }
+
+    try:
+        if args.instances > 1:
+            await bench_processes(args, ctx, sqlite_path, journal_dir)
+        else:
+            await bench_in_process(args, ctx, httpx)
+    finally:
+        if journal_dir:
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+    fake.stop()
+    tg.stop()
+    return ctx["rows"]
+
+
+async def run_levels(args, ctx):
+    ctx["rows"] = []
+    for users in args.levels:
+        ctx["rows"].append(await run_level(users, ctx))
+        print(json.dumps(ctx["rows"][-1], ensure_ascii=False), flush=True)
+
+
+async def bench_in_process(args, ctx, httpx):
+    """One bot imported here, driven through httpx.ASGITransport."""
+    import main
+
+    jsonbin = None
+    if args.backend == "jsonbin":
+        import jsonbin
+
+    async def begin_level():
+        if jsonbin is not None:
+            # در حالت ژورنال invalidate_cache فقط حالت محلی را دوباره می‌خواند
+            await jsonbin.async_refresh()
+        else:
+            await main.storage.reset_week()
+
+    async def end_level():
+        if jsonbin is not None:
+            # نتیجه از روی bin سنجیده می‌شود؛ ژورنال باید اول push شود
+            await jsonbin._final_sync(jsonbin.SHUTDOWN_SYNC_DEADLINE)
+
+    async def load_final():
+        return ctx["fake"].snapshot() if jsonbin is not None else await main.storage.load()
+
+    await main.startup()
+    transport = httpx.ASGITransport(app=main.build_asgi_app())
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ctx.update(begin_level=begin_level, end_level=end_level,
+                   load_final=load_final, client_for=lambda uid: client)
+        await run_levels(args, ctx)
+
+    await main.shutdown()
+
+
+async def bench_processes(args, ctx, sqlite_path, journal_dir):
+    """Fresh bot processes per level, so no instance starts with a stale cache."""
+    sqlite = None
+    if args.backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        sqlite = SqliteStorage(sqlite_path)
+
+    instances = Instances(args.instances, dict(os.environ), journal_dir)
+
+    async def begin_level():
+        if sqlite is not None:
+            await sqlite.reset_week()
+        await instances.start()
+
+    async def end_level():
+        await instances.stop()
+
+    async def load_final():
+        return ctx["fake"].snapshot() if sqlite is None else await sqlite.load()
+
+    ctx.update(begin_level=begin_level, end_level=end_level,
+               load_final=load_final, client_for=instances.client_for)
+    try:
+        await run_levels(args, ctx)
+    finally:
+        await instances.stop()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Reservation bot load test")
+    parser.add_argument("--levels", default="1,10,50",
+                        type=lambda s: [int(x) for x in s.split(",")],
+                        help="comma-separated concurrent user counts")
+    parser.add_argument("--latency", type=float, default=100, help="fake JSONBin ms per request")
+    parser.add_argument("--rate", type=float, default=0, help="fake JSONBin requests/s (0 = unlimited)")
+    parser.add_argument("--backend", choices=["jsonbin", "sqlite"], default="jsonbin")
+    parser.add_argument("--instances", type=int, default=1,
+                        help="bot processes sharing the stand-ins (>1 = cross-process run)")
+    parser.add_argument("--journal", action="store_true",
+                        help="enable the local journal (one per instance, in a temp dir)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.journal and os.getenv("JSONBIN_VERIFY_WRITES", "0") == "1":
+        # main.py با این ترکیب بالا نمی‌آید
+        parser.error("--journal cannot be combined with JSONBIN_VERIFY_WRITES=1")
+    if args.journal and args.backend != "jsonbin":
+        parser.error("--journal only applies to --backend jsonbin")
+
+    random.seed(args.seed)
+    rows = asyncio.run(bench(args))
+    print()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,55 @@
+"""Synthetic Telegram Update payloads for driving the bot's webhook."""
+import time
+import itertools
+
+
+class UpdateFactory:
+    """Builds update dicts with unique, increasing update_id / message_id."""
+
+    def __init__(self, start=1):
+        self._ids = itertools.count(start)
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def message(self, user_id, text):
+        update_id = next(self._ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id, data, message_id=1):
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "…",
+                },
+            },
+        }
+
+
+def keyboard_choices(markup):
+    """Flatten the button texts of a ReplyKeyboardMarkup dict."""
+    if not markup or "keyboard" not in markup:
+        return []
+    return [b["text"] if isinstance(b, dict) else b for row in markup["keyboard"] for b in row]
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# ============================================================
+#  CONSTANTS
+# ============================================================
+TZ = ZoneInfo("Asia/Tehran")
+
+CAPACITY = 3  # تعداد ظرفیت رزرو در هر روز
+
+RESET_WEEKDAY = 4  # جمعه  (Monday=0, Friday=4)
+
+SLOT_LABELS = ["18-19", "19-20", "20-21"]
+FIRST_SLOT_HOUR = 18
+
+DAYS = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه",
+        "چهارشنبه", "پنجشنبه", "جمعه"]
+
+MSG_INVALID_DAY = "❌ روز وارد شده معتبر نیست."
+MSG_INVALID_SLOT = "❌ بازه زمانی نامعتبر است."
+MSG_SLOT_TAKEN = "❌ این بازه قبلاً رزرو شده است."
+MSG_RESERVED = "✅ رزرو با موفقیت ثبت شد."
+MSG_CANCELLED = "🔄 رزرو شما لغو شد."
+MSG_NOT_FOUND = "❌ رزروی برای شما یافت نشد."
+MSG_UNAVAILABLE = "⚠️ سرویس رزرو موقتاً در دسترس نیست؛ لطفاً کمی بعد دوباره تلاش کنید."
+
+
+# ============================================================
+#  HELPERS
+# ============================================================
+def today_str():
+    """Return today's date in Iran timezone."""
+    return datetime.now(TZ).strftime("%Y-%m-%d")
+
+
+def now_tehran():
+    """Return now() in Iran timezone."""
+    return datetime.now(TZ)
+
+
+# ============================================================
+#  DOCUMENT LOGIC
+#  سند رزرو: {"last_reset": "YYYY-MM-DD", "<روز>": [cell] * CAPACITY}
+#  cell = False  یا  {"name": ..., "id": ...}
+# ============================================================
+def last_reset_boundary(now=None):
+    """Date (YYYY-MM-DD) of the most recent Friday 00:00 Tehran, today included."""
+    now = now or now_tehran()
+    days_since = (now.weekday() - RESET_WEEKDAY) % 7
+    return (now - timedelta(days=days_since)).strftime("%Y-%m-%d")
+
+
+def next_reset_at(now=None):
+    """Aware datetime of the next Friday 00:00 Tehran strictly after now."""
+    now = now or now_tehran()
+    days_ahead = (RESET_WEEKDAY - now.weekday()) % 7 or 7
+    target = (now + timedelta(days=days_ahead)).date()
+    return datetime(target.year, target.month, target.day, tzinfo=TZ)
+
+
+def slot_start(day, slot, now=None):
+    """
+    Aware datetime when (day, slot) starts in the current week. The week
+    runs from the reset Friday (جمعه) through the following Thursday.
+    """
+    now = now or now_tehran()
+    friday = datetime.strptime(last_reset_boundary(now), "%Y-%m-%d")
+    offset = (DAYS.index(day) + 1) % 7  # شنبه=1 ... پنجشنبه=6، جمعه=0
+    start = friday + timedelta(days=offset, hours=FIRST_SLOT_HOUR + slot)
+    return start.replace(tzinfo=TZ)
+
+
+def is_reset_due(last_reset):
+    """
+    Return True if the week was not reset since the last Friday 00:00
+    (Tehran). A reset missed while the bot was down is therefore caught
+    up on the next check.
+    """
+    return (last_reset or "") < last_reset_boundary()
+
+
+def empty_week():
+    """A freshly reset reservation document."""
+    data = {"last_reset": today_str()}
+    for d in DAYS:
+        data[d] = [False] * CAPACITY
+    return data
+
+
+def apply_reserve(data, day, slot, full_name, telegram_id):
+    """Book the slot in `data` in place. Returns (changed, message)."""
+    if day not in data:
+        return False, MSG_INVALID_DAY
+
+    # ساختار را تضمین می‌کنیم
+    if not isinstance(data[day], list) or len(data[day]) != CAPACITY:
+        data[day] = [False] * CAPACITY
+
+    if slot < 0 or slot >= CAPACITY:
+        return False, MSG_INVALID_SLOT
+
+    # اگر اسلات پر باشد
+    if data[day][slot] not in (False, None):
+        return False, MSG_SLOT_TAKEN
+
+    data[day][slot] = {
+        "name": full_name,
+        "id": telegram_id
+    }
+    return True, MSG_RESERVED
+
+
+def apply_cancel(data, telegram_id, cells=None):
+    """
+    Clear cells held by telegram_id in place. Returns True if any.
+
+    cells limits the check to those (day, slot) pairs; by default every
+    cell of the week is scanned.
+    """
+    if cells is None:
+        cells = [(d, i) for d in DAYS for i in range(CAPACITY)]
+
+    removed = False
+    for d, i in cells:
+        row = data.get(d)
+        if isinstance(row, list) and 0 <= i < len(row):
+            cell = row[i]
+            if isinstance(cell, dict) and cell.get("id") == telegram_id:
+                row[i] = False
+                removed = True
+
+    return removed
+
+
+def build_index(data):
+    """Return {telegram_id: [(day, slot), ...]} in week order."""
+    index = {}
+    for d in DAYS:
+        row = data.get(d)
+        if not isinstance(row, list):
+            continue
+        for i, cell in enumerate(row[:CAPACITY]):
+            if isinstance(cell, dict) and "id" in cell:
+                index.setdefault(cell["id"], []).append((d, i))
+    return index
+
+
+def free_slots(data):
+    """Return {day: [free slot indexes]} for every day in DAYS."""
+    result = {}
+    for d in DAYS:
+        cells = data.get(d)
+        if not isinstance(cells, list) or len(cells) != CAPACITY:
+            cells = [False] * CAPACITY
+        result[d] = [i for i, cell in enumerate(cells) if cell in (False, None)]
+    return result
@@ -0,0 +1,114 @@
+import os
+import asyncio
+import logging
+
+from ratelimit import KeyedBuckets, RecentIds
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------
+# ENV
+# ------------------------------------------------
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))
+
+# تلگرام در صورت پاسخ کند همان update را دوباره می‌فرستد
+SEEN_UPDATES_MAX = int(os.getenv("SEEN_UPDATES_MAX", "5000"))
+SEEN_UPDATES_TTL = float(os.getenv("SEEN_UPDATES_TTL", "3600"))
+
+# محدودیت هر کاربر: USER_RATE update در ثانیه، با انفجار تا USER_BURST
+USER_RATE = float(os.getenv("USER_RATE", "1"))
+USER_BURST = float(os.getenv("USER_BURST", "5"))
+
+
+# ------------------------------------------------
+# Update queue
+# ------------------------------------------------
+class UpdateQueue:
+    """
+    Bounded in-flight queue between the webhook and the Application.
+
+    Updates are spread over `concurrency` lanes by user id, so each
+    user's updates stay in order (ConversationHandler relies on that)
+    while different users are processed in parallel. offer() never
+    blocks: it returns False when the lane is full so the webhook can
+    answer with backpressure and let Telegram redeliver later.
+
+    Redelivered update_ids and updates from users over their token
+    bucket are dropped here, before any handler or storage call.
+    """
+
+    def __init__(self, application, maxsize=UPDATE_QUEUE_SIZE,
+                 concurrency=UPDATE_CONCURRENCY):
+        self.application = application
+        self.concurrency = max(1, concurrency)
+        self.lane_size = max(1, maxsize // self.concurrency)
+        self._lanes: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.seen = RecentIds(SEEN_UPDATES_MAX, SEEN_UPDATES_TTL)
+        self.limits = KeyedBuckets(USER_RATE, USER_BURST)
+
+    async def start(self):
+        """Create the lanes and their workers on the running loop."""
+        self._lanes = [asyncio.Queue(maxsize=self.lane_size)
+                       for _ in range(self.concurrency)]
+        self._workers = [
+            asyncio.create_task(self._worker(q), name=f"update-worker-{i}")
+            for i, q in enumerate(self._lanes)
+        ]
+
+    async def stop(self):
+        """Let queued updates finish, then stop the workers."""
+        for q in self._lanes:
+            await q.join()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _lane(self, update):
+        user = update.effective_user
+        key = user.id if user is not None else update.update_id
+        return self._lanes[key % self.concurrency]
+
+    def offer(self, update):
+        """Queue update without waiting. Must run on the bot loop."""
+        if not self._lanes:
+            raise RuntimeError("UpdateQueue not started")
+
+        # تکراری یا بیش از حد مجاز: با 200 پاسخ می‌دهیم تا دوباره ارسال نشود
+        if update.update_id in self.seen:
+            logger.info("Duplicate update %s dropped", update.update_id)
+            return True
+
+        # پیش از مصرف توکن کاربر؛ update ردشده دوباره ارسال می‌شود
+        lane = self._lane(update)
+        if lane.full():
+            logger.warning("⚠️ Update queue full, rejecting update %s", update.update_id)
+            return False
+
+        user = update.effective_user
+        if user is not None and not self.limits.try_acquire(user.id):
+            logger.warning("⚠️ Flood control: update %s from %s dropped",
+                           update.update_id, user.id)
+            self.seen.add(update.update_id)
+            return True
+
+        lane.put_nowait(update)
+
+        # فقط پس از پذیرش؛ update ردشده (503) باید دوباره قابل پذیرش باشد
+        self.seen.add(update.update_id)
+        self.in_flight += 1
+        return True
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                logger.exception("❌ UPDATE ERROR: %s", e)
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
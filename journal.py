@@ -0,0 +1,232 @@
+import os
+import copy
+import json
+import time
+import threading
+
+from booking import CAPACITY, DAYS
+
+# ============================================================
+#  LOAD ENV
+#  با JOURNAL_PATH خالی ژورنال غیرفعال است.
+#  JOURNAL_PATH و SNAPSHOT_PATH باید روی دیسک ماندگار باشند: رزرو پس از
+#  نوشتن در ژورنال تأیید می‌شود و روی دیسک موقت (مثلاً Render بدون disk)
+#  رکوردهای همگام‌نشده با هر deploy یا restart از بین می‌روند.
+# ============================================================
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "journal.jsonl")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.json")
+SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "200"))  # تعداد رکورد
+
+
+# ============================================================
+#  DIFF / APPLY
+#  هر رکورد اثر یک تغییر را نگه می‌دارد، نه نیت آن را:
+#  {"seq", "ts", "op", "cells": [[day, slot, before, after], ...],
+#   "last_reset": ...}
+# ============================================================
+def _cell(data, day, slot):
+    row = data.get(day)
+    if isinstance(row, list) and 0 <= slot < len(row):
+        return row[slot]
+    return False
+
+
+def _set_cell(data, day, slot, value):
+    row = data.get(day)
+    if not isinstance(row, list) or len(row) != CAPACITY:
+        row = data[day] = [False] * CAPACITY
+    row[slot] = value
+
+
+def diff_doc(before, after):
+    """Return the cell and last_reset changes between two documents."""
+    change = {"cells": []}
+    for d in DAYS:
+        for i in range(CAPACITY):
+            old, new = _cell(before, d, i), _cell(after, d, i)
+            if old != new:
+                change["cells"].append([d, i, old, new])
+
+    if before.get("last_reset") != after.get("last_reset"):
+        change["last_reset"] = after.get("last_reset")
+    return change
+
+
+def apply_entry(data, entry):
+    """Replay one journal entry onto data in place."""
+    if "last_reset" in entry:
+        data["last_reset"] = entry["last_reset"]
+    for d, i, _, new in entry.get("cells", []):
+        _set_cell(data, d, i, new)
+
+
+def rebase(data, entries):
+    """
+    Replay entries onto a document that may have changed elsewhere.
+
+    A cell is only written if it still holds the entry's "before" value
+    (a per-cell compare-and-swap); resets are always applied. Returns
+    the list of (seq, day, slot, winner) that lost to a concurrent
+    change, winner being the value the cell kept.
+    """
+    conflicts = []
+    for entry in entries:
+        if entry.get("op") == "reset":
+            apply_entry(data, entry)
+            continue
+
+        if "last_reset" in entry:
+            data["last_reset"] = entry["last_reset"]
+        for d, i, old, new in entry.get("cells", []):
+            current = _cell(data, d, i)
+            if current == old or current == new:
+                _set_cell(data, d, i, new)
+            else:
+                conflicts.append((entry["seq"], d, i, current))
+    return conflicts
+
+
+# ============================================================
+#  JOURNAL
+# ============================================================
+class Journal:
+    """
+    Append-only JSON-lines log of reservation changes plus a compacted
+    snapshot. {"op": "sync", "seq": n} lines mark what reached JSONBin;
+    their "conflicts" ([seq, day, slot, winner]) record cells an entry
+    lost during rebase, so replay() keeps the winner instead.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, snapshot_path=SNAPSHOT_PATH,
+                 snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.synced_seq = 0
+        self._unsynced = []       # رکوردهایی که هنوز به JSONBin نرسیده‌اند
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+
+    # --------------------------------------------
+    # write
+    # --------------------------------------------
+    def _write(self, lines):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, changes):
+        """Append [(op, change)] atomically; returns the written entries."""
+        with self._lock:
+            entries = []
+            for op, change in changes:
+                self.seq += 1
+                entries.append({"seq": self.seq, "ts": time.time(),
+                                "op": op, **change})
+            self._write(entries)
+            self._unsynced.extend(entries)
+            self._since_snapshot += len(entries)
+            return entries
+
+    def pending(self):
+        """Entries not yet pushed to JSONBin, oldest first."""
+        with self._lock:
+            return list(self._unsynced)
+
+    def mark_synced(self, seq, conflicts=()):
+        """Record that everything up to seq is on JSONBin."""
+        with self._lock:
+            line = {"seq": seq, "ts": time.time(), "op": "sync"}
+            if conflicts:
+                line["conflicts"] = [list(c) for c in conflicts]
+            self._write([line])
+            self.synced_seq = max(self.synced_seq, seq)
+            self._unsynced = [e for e in self._unsynced if e["seq"] > seq]
+
+    def snapshot_due(self):
+        with self._lock:
+            return not self._unsynced and self._since_snapshot >= self.snapshot_every
+
+    def snapshot(self, data):
+        """
+        Write data as the new snapshot and rotate the journal to
+        <path>.<seq> (kept as the audit trail). Only call when fully synced.
+        """
+        with self._lock:
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"seq": self.seq, "doc": data}, f,
+                          ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.{self.seq}")
+            self._since_snapshot = 0
+
+    # --------------------------------------------
+    # read
+    # --------------------------------------------
+    def _truncate(self, size):
+        """Cut the journal back to size bytes so the next append starts on a fresh line."""
+        if os.path.getsize(self.path) > size:
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"⚠️ Journal: dropped a torn tail after byte {size}")
+
+    def replay(self):
+        """
+        Rebuild the document from the snapshot plus the journal tail.
+        Returns None if neither exists.
+        """
+        data, base_seq = None, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snap = json.load(f)
+            data, base_seq = snap["doc"], snap["seq"]
+
+        entries, synced, lost = [], base_seq, {}
+        if os.path.exists(self.path):
+            good_end = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    # خط ناقص آخر (قطع برق) و هرچه بعد از آن است کنار گذاشته می‌شود
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    good_end += len(line)
+                    if entry.get("op") == "sync":
+                        synced = max(synced, entry["seq"])
+                        for c in entry.get("conflicts", []):
+                            lost[(c[0], c[1], c[2])] = c
+                    elif entry["seq"] > base_seq:
+                        entries.append(entry)
+            self._truncate(good_end)
+
+        if data is None and not entries:
+            return None
+
+        data = copy.deepcopy(data) if data is not None else {}
+        for entry in entries:
+            apply_entry(data, entry)
+            for d, i, old, _ in entry.get("cells", []):
+                c = lost.get((entry["seq"], d, i))
+                if c is not None:
+                    # خانه‌ای که در rebase باخته: مقدار برنده (یا قبلی در رکورد قدیمی)
+                    _set_cell(data, d, i, c[3] if len(c) > 3 else old)
+
+        with self._lock:
+            self.seq = max([base_seq] + [e["seq"] for e in entries])
+            self.synced_seq = synced
+            self._unsynced = [e for e in entries if e["seq"] > synced]
+            self._since_snapshot = len(entries)
+        return data
@@ -1,10 +1,32 @@
 import os
-import requests
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import copy
+import random
+import asyncio
+import httpx
 import time
 import threading
 
+from booking import (
+    MSG_CANCELLED,
+    MSG_NOT_FOUND,
+    MSG_SLOT_TAKEN,
+    is_reset_due,
+    empty_week,
+    apply_reserve,
+    apply_cancel,
+    build_index,
+    free_slots,
+)
+from journal import JOURNAL_PATH, Journal, apply_entry, diff_doc, rebase
+from metrics import STORAGE_SECONDS, BOOKINGS, CONFLICTS, RESETS, timed
+from resilience import (
+    CircuitBreaker,
+    RateLimited,
+    async_retry_call,
+    async_retry_rate_limited,
+)
+from storage import Storage, StorageUnavailable
+
 # ============================================================
 #  LOAD ENV
 # ============================================================
@@ -14,148 +36,763 @@ JSONBIN_ID  = os.getenv("JSONBIN_ID")
 if not JSONBIN_KEY or not JSONBIN_ID:
     raise RuntimeError("❌ JSONBIN_KEY / JSONBIN_ID is missing in ENV")
 
-BASE_URL = f"https://api.jsonbin.io/v3/b/{JSONBIN_ID}"
-CAPACITY = 3  # تعداد ظرفیت رزرو در هر روز
+JSONBIN_API = os.getenv("JSONBIN_API", "https://api.jsonbin.io/v3")
+BASE_URL = f"{JSONBIN_API}/b/{JSONBIN_ID}"
+
+# حداکثر عمر کش محلی (ثانیه) قبل از اعتبارسنجی مجدد با JSONBin
+CACHE_MAX_AGE = float(os.getenv("JSONBIN_CACHE_MAX_AGE", "300"))
+
+# هر درخواست حداکثر JSONBIN_TIMEOUT ثانیه؛ خواندن‌ها تا READ_RETRIES بار تکرار
+TIMEOUT = float(os.getenv("JSONBIN_TIMEOUT", "5"))
+READ_RETRIES = int(os.getenv("JSONBIN_READ_RETRIES", "2"))
+
+# پس از BREAKER_THRESHOLD خطای پیاپی، به مدت BREAKER_RESET ثانیه
+# بدون تماس با شبکه خطا می‌دهیم (خواندن‌ها از آخرین وضعیت معلوم)
+BREAKER_THRESHOLD = int(os.getenv("JSONBIN_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("JSONBIN_BREAKER_RESET", "30"))
+
+# پاسخ 429 خطای سرویس نیست: PUT پس از Retry-After (پیش‌فرض RATE_LIMIT_DELAY)
+# دوباره فرستاده می‌شود، تا وقتی از WRITE_DEADLINE ثانیه نگذشته باشد
+RATE_LIMIT_DELAY = float(os.getenv("JSONBIN_RATE_LIMIT_DELAY", "1"))
+WRITE_DEADLINE = float(os.getenv("JSONBIN_WRITE_DEADLINE", "10"))
+
+# با JOURNAL_PATH، نسخه محلی (snapshot + ژورنال) مرجع است و JSONBin
+# به‌صورت غیرهمزمان با آن همگام می‌شود
+_journal = Journal() if JOURNAL_PATH else None
+
+
+# ============================================================
+#  LOCAL CACHE
+# ============================================================
+_cache = {
+    "record": None,      # آخرین نسخه سند
+    "etag": None,        # ETag پاسخ JSONBin (در صورت وجود)
+    "version": None,     # metadata.version (در صورت وجود)
+    "fetched_at": 0.0,   # time.monotonic() آخرین همگام‌سازی
+    "index": {},         # telegram_id -> [(day, slot)] روی همین نسخه
+    "availability": None,  # {day: [free slots]} روی همین نسخه
+}
+_cache_lock = threading.Lock()
+
+
+def invalidate_cache():
+    """
+    Drop the cached record. Outside journal mode the next read goes to
+    JSONBin; in journal mode it reloads the local snapshot + journal.
+    async_refresh() pulls the remote document in both modes.
+    """
+    with _cache_lock:
+        _cache["record"] = None
+        _cache["etag"] = None
+        _cache["version"] = None
+        _cache["fetched_at"] = 0.0
+        _cache["index"] = {}
+        _cache["availability"] = None
+
+
+def _cache_store(record, etag=None, version=None):
+    """Replace the cached record after a successful GET/PUT."""
+    with _cache_lock:
+        _cache["record"] = copy.deepcopy(record)
+        _cache["etag"] = etag
+        _cache["version"] = version
+        _cache["fetched_at"] = time.monotonic()
+        _cache["index"] = build_index(record)
+        _cache["availability"] = free_slots(record)
+
+
+def _cache_get(max_age):
+    """Return a copy of the cached record if younger than max_age, else None."""
+    with _cache_lock:
+        if _cache["record"] is None:
+            return None
+        # در حالت ژورنال کش همان وضعیت مرجع است و منقضی نمی‌شود
+        if _journal is None and time.monotonic() - _cache["fetched_at"] > max_age:
+            return None
+        return copy.deepcopy(_cache["record"])
+
+
+def user_cells(telegram_id):
+    """(day, slot) pairs held by telegram_id in the cached record."""
+    with _cache_lock:
+        return list(_cache["index"].get(telegram_id, []))
+
+
+def cached_availability():
+    """Free slots per day from the cached record (even if stale), or None."""
+    with _cache_lock:
+        view = _cache["availability"]
+        if view is None:
+            return None
+        return {d: list(slots) for d, slots in view.items()}
+
+
+def _metadata_version(body):
+    meta = body.get("metadata") or {}
+    return meta.get("version")
 
 
 # ============================================================
-#  HELPERS
+#  JSONBIN READ / WRITE
 # ============================================================
-def today_str():
-    """Return today's date in Iran timezone."""
-    return datetime.now(ZoneInfo("Asia/Tehran")).strftime("%Y-%m-%d")
+def _read_headers():
+    """Headers for a GET, conditional on the cached ETag when we have one."""
+    headers = {"X-Master-Key": JSONBIN_KEY}
+    with _cache_lock:
+        if _cache["record"] is not None and _cache["etag"]:
+            headers["If-None-Match"] = _cache["etag"]
+    return headers
+
+
+def _not_modified():
+    """Handle a 304: refresh the cache timestamp and return the record (or None)."""
+    with _cache_lock:
+        if _cache["record"] is None:
+            return None
+        _cache["fetched_at"] = time.monotonic()
+        return copy.deepcopy(_cache["record"])
+
+
+def _store_put(data, r):
+    """Update the cache in place after a successful PUT."""
+    try:
+        version = _metadata_version(r.json())
+    except ValueError:
+        version = None
+    _cache_store(data, r.headers.get("ETag"), version)
+
+
+_breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET, name="JSONBin")
+
 
+def _retry_after(r):
+    try:
+        return max(0.0, float(r.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return RATE_LIMIT_DELAY
 
-def now_tehran():
-    """Return now() in Iran timezone."""
-    return datetime.now(ZoneInfo("Asia/Tehran"))
+
+def _check_response(r):
+    """Feed the breaker; 5xx counts as JSONBin being unhealthy, 429 does not."""
+    if r.status_code == 429:
+        _breaker.record_throttled()
+        raise RateLimited("❌ JSONBin HTTP 429", _retry_after(r))
+    if r.status_code >= 500:
+        _breaker.record_failure()
+        raise StorageUnavailable(f"❌ JSONBin HTTP {r.status_code}")
+    _breaker.record_success()
+    return r
+
+
+def _last_known():
+    """Degraded mode: the cached record regardless of age, or None."""
+    return _cache_get(float("inf"))
 
 
 # ============================================================
-#  JSONBIN READ / WRITE
+#  ASYNC JSONBIN READ / WRITE
 # ============================================================
-def get_data():
-    r = requests.get(BASE_URL, headers={"X-Master-Key": JSONBIN_KEY})
+_async_client: httpx.AsyncClient | None = None
+
+
+def _get_async_client():
+    """Shared keep-alive client; created lazily on the calling event loop."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            headers={"X-Master-Key": JSONBIN_KEY},
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            timeout=httpx.Timeout(TIMEOUT),
+        )
+    return _async_client
+
+
+async def aclose():
+    """Close the shared async client (call on shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _async_request(method, **kwargs):
+    """One guarded HTTP call to the bin; TIMEOUT is an overall deadline."""
+    _breaker.before_call()
+    try:
+        r = await asyncio.wait_for(
+            _get_async_client().request(method, BASE_URL, **kwargs), TIMEOUT
+        )
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        _breaker.record_failure()
+        raise StorageUnavailable(f"❌ JSONBin {method} failed: {e!r}") from e
+    return _check_response(r)
+
+
+@timed(STORAGE_SECONDS, op="get_data")
+async def async_get_data(max_age=None, allow_stale=True):
+    """
+    Return the reservation document.
+
+    Served from the local cache while it is younger than `max_age`
+    seconds (default CACHE_MAX_AGE); otherwise revalidated against
+    JSONBin with If-None-Match so an unchanged bin costs a 304.
+    If JSONBin is unreachable and allow_stale is set, the last known
+    document is returned instead.
+    """
+    if max_age is None:
+        max_age = CACHE_MAX_AGE
+
+    cached = _cache_get(max_age)
+    if cached is not None:
+        return cached
+
+    if _journal is not None and _journal_restore():
+        _schedule_sync()
+        # ژورنال فقط تغییرهای خودمان را دارد؛ بقیه از JSONBin گرفته می‌شود
+        _schedule_refresh()
+        return _cache_get(max_age)
+
+    try:
+        r = await async_retry_call(
+            lambda: _async_request("GET", headers=_read_headers()),
+            retries=READ_RETRIES,
+        )
+    except StorageUnavailable:
+        stale = _last_known() if allow_stale else None
+        if stale is None:
+            raise
+        return stale
+
+    if r.status_code == 304:
+        data = _not_modified()
+        if data is not None:
+            return data
+        # کش بین درخواست و پاسخ پاک شده است
+        return await async_get_data(max_age=0, allow_stale=allow_stale)
+
     if r.status_code != 200:
         raise RuntimeError("❌ ERROR reading JSONBin")
-    return r.json()["record"]
 
+    body = r.json()
+    if _journal is not None:
+        return _journal_seed(body["record"])
+    _cache_store(body["record"], r.headers.get("ETag"), _metadata_version(body))
+    return body["record"]
 
-def save_data(data: dict):
-    r = requests.put(BASE_URL, json=data, headers={"X-Master-Key": JSONBIN_KEY})
+
+@timed(STORAGE_SECONDS, op="save_data")
+async def async_save_data(data: dict):
+    """Write the whole document to JSONBin and refresh the cache in place."""
+    r = await async_retry_rate_limited(
+        lambda: _async_request("PUT", json=data), WRITE_DEADLINE
+    )
     if r.status_code != 200:
         raise RuntimeError("❌ ERROR writing JSONBin")
 
+    _store_put(data, r)
+
 
 # ============================================================
-#  AUTO RESET LOGIC
+#  CONCURRENCY CONTROL
+#  هر سند یک شمارنده "version" دارد. داخل پروسه نوشتن‌ها با
+#  _async_commit_lock (و صف ادغام) پشت سر هم انجام می‌شوند.
+#  JSONBin PUT شرطی ندارد، پس فرض بر یک نویسنده است؛ با
+#  JSONBIN_VERIFY_WRITES=1 (چند نمونه ربات) پیش از PUT نسخه سرور
+#  بررسی و پس از آن سند دوباره خوانده می‌شود تا نوشتن ازدست‌رفته
+#  تشخیص داده و دوباره اعمال شود. این پنجره را کوچک می‌کند، نه صفر.
 # ============================================================
-def need_reset(data=None):
-    """Return True if it's Friday midnight (Tehran) and not reset yet."""
-    if data is None:
-        data = get_data()
+WRITE_RETRIES = int(os.getenv("JSONBIN_WRITE_RETRIES", "5"))
+VERIFY_WRITES = os.getenv("JSONBIN_VERIFY_WRITES", "0") == "1"
 
-    last_reset = data.get("last_reset", "")
-    now = now_tehran()
 
-    # جمعه == weekday 4  (Monday=0, Friday=4)
-    if now.weekday() != 4:
-        return False
+# ژورنال رزرو را پیش از رسیدن به JSONBin تأیید می‌کند؛ با چند نمونه،
+# دو نمونه می‌توانند یک خانه را به دو نفر بدهند
+if _journal is not None and VERIFY_WRITES:
+    raise RuntimeError(
+        "❌ JSONBIN_VERIFY_WRITES=1 (several instances) needs the journal off: set JOURNAL_PATH="
+    )
 
-    # هنوز reset امروز انجام نشده
-    return last_reset != today_str()
 
+class WriteConflictError(StorageUnavailable):
+    """The document kept changing underneath us for WRITE_RETRIES attempts."""
 
-def reset_reservations():
-    """Reset all daily reservations."""
-    data = {"last_reset": today_str()}
 
-    days = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه",
-            "چهارشنبه", "پنجشنبه", "جمعه"]
+# بخش بررسی و نوشتن باید در داخل پروسه اتمیک باشد
+_async_commit_lock = asyncio.Lock()
 
-    for d in days:
-        data[d] = [False] * CAPACITY
 
-    save_data(data)
-    print("🧹 RESET: all reservations cleared.")
+def doc_version(data):
+    return int(data.get("version") or 0)
+
+
+def _backoff(attempt):
+    return random.uniform(0, 0.05 * (attempt + 1))
+
+
+def _write_landed(remote, change):
+    """True if every cell (and last_reset) in change already holds in remote."""
+    probe = copy.deepcopy(remote)
+    apply_entry(probe, change)
+    return probe == remote
+
 
+async def async_mutate(apply):
+    """
+    Read-modify-write the document.
+
+    apply(data) edits data in place and returns (changed, result);
+    result is returned once the change is stored. With VERIFY_WRITES
+    a write that another instance overwrote is detected and re-applied
+    on the newer document.
+    """
+    for attempt in range(WRITE_RETRIES):
+        data = await async_get_data()
+        before = copy.deepcopy(data)
+        base = doc_version(data)
+
+        changed, result = apply(data)
+        if not changed:
+            return result
+        data["version"] = base + 1
+
+        async with _async_commit_lock:
+            if not VERIFY_WRITES:
+                await async_save_data(data)
+                return result
+
+            current = await async_get_data(max_age=0, allow_stale=False)
+            if doc_version(current) == base:
+                await async_save_data(data)
+                # 304 یعنی سند همان نسخه ماست؛ در غیر این صورت تغییر ما باید در آن باشد
+                after = await async_get_data(max_age=0, allow_stale=False)
+                if _write_landed(after, diff_doc(before, data)):
+                    return result
+                CONFLICTS.inc(type="lost_write")
+                print("⚠️ JSONBin write was overwritten, re-applying")
+            else:
+                CONFLICTS.inc(type="version")
+                print("⚠️ JSONBin version conflict, retrying")
+
+        await asyncio.sleep(_backoff(attempt))
+
+    raise WriteConflictError("❌ JSONBin write conflict")
+
+
+# ============================================================
+#  WRITE COALESCING
+#  تغییرهایی که در یک پنجره کوتاه می‌رسند به ترتیب روی یک نسخه از سند
+#  اعمال و با یک PUT ذخیره می‌شوند؛ هر فراخواننده نتیجه خودش را می‌گیرد.
+# ============================================================
+COALESCE_WINDOW = float(os.getenv("JSONBIN_COALESCE_MS", "50")) / 1000
+
+
+class WriteBatcher:
+    """Queue of async mutations committed together through async_mutate()."""
+
+    def __init__(self, window=COALESCE_WINDOW):
+        self.window = window
+        self._pending = []
+        self._flusher: asyncio.Task | None = None
+
+    async def submit(self, op):
+        """Queue op (see async_mutate()) and wait for its own result."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((op, fut))
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+        return await fut
+
+    async def _flush_loop(self):
+        await asyncio.sleep(self.window)
+
+        # هرچه در حین PUT برسد در دور بعدی ذخیره می‌شود
+        while self._pending:
+            batch, self._pending = self._pending, []
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        def apply_all(data):
+            changed, results = False, []
+            for op, _ in batch:
+                op_changed, result = op(data)
+                changed = changed or op_changed
+                results.append(result)
+            return changed, results
+
+        try:
+            if _journal is not None:
+                results = await _journal_commit(batch)
+            else:
+                results = await async_mutate(apply_all)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (op, fut), result in zip(batch, results):
+            if getattr(op, "previous", None) is not None:
+                _fire("on_reset", op.previous)
+            if not fut.done():
+                fut.set_result(result)
+
+
+_batcher = WriteBatcher()
+
+
+# ============================================================
+#  JOURNAL MODE
+#  تغییرها پس از نوشتن در ژورنال محلی تأیید می‌شوند و یک task جدا
+#  آن‌ها را به JSONBin می‌رساند (در صورت تغییر هم‌زمان: rebase).
+# ============================================================
+SYNC_RETRY_DELAY = float(os.getenv("JOURNAL_SYNC_RETRY", "5"))
+# هنگام خاموش شدن حداکثر این مدت برای رساندن رکوردهای باقی‌مانده صبر می‌شود
+SHUTDOWN_SYNC_DEADLINE = float(os.getenv("JOURNAL_SHUTDOWN_SYNC", "10"))
+
+_sync_state = {
+    "remote_version": None,  # نسخه‌ای که آخرین بار خودمان PUT کردیم
+    "task": None,
+    "refresh": None,
+}
+_local_lock = asyncio.Lock()
+
+
+def _journal_restore():
+    """Load the local state from snapshot + journal. Returns False if none."""
+    data = _journal.replay()
+    if data is None:
+        return False
+    _cache_store(data)
+    print(f"📒 Journal restored up to seq {_journal.seq}")
     return True
 
 
-def auto_reset_worker():
-    """Background thread checking periodic reset."""
-    while True:
+def _journal_seed(data):
+    """
+    First remote load in journal mode: keep it as the base snapshot.
+    If a concurrent load or commit got there first, the local state wins.
+    """
+    local = _cache_get(0)
+    if local is not None:
+        return local
+    _cache_store(data)
+    _journal.snapshot(data)
+    return copy.deepcopy(data)
+
+
+async def _journal_commit(batch):
+    """Apply a batch to the local state and append its effects to the journal."""
+    async with _local_lock:
+        data = await async_get_data()
+        changes, results = [], []
+
+        for op, _ in batch:
+            before = copy.deepcopy(data)
+            changed, result = op(data)
+            if changed:
+                changes.append((getattr(op, "kind", "mutate"), diff_doc(before, data)))
+            results.append(result)
+
+        if changes:
+            await asyncio.to_thread(_journal.append, changes)
+            _cache_store(data)
+            _schedule_sync()
+
+    return results
+
+
+def _schedule_sync():
+    task = _sync_state["task"]
+    if task is None or task.done():
+        _sync_state["task"] = asyncio.get_running_loop().create_task(_sync_loop())
+
+
+async def _sync_loop():
+    while _journal.pending():
         try:
-            if need_reset():
-                print("🧹 Auto-RESET triggered at Friday midnight (Iran)")
-                reset_reservations()
+            await _sync_once()
         except Exception as e:
-            print("❌ Auto-reset error:", e)
+            print("❌ Journal sync error:", e)
+            await asyncio.sleep(SYNC_RETRY_DELAY)
+
+    # سند و seq باید با هم خوانده شوند؛ commit هم‌زمان نباید بین آن‌ها بیاید
+    async with _local_lock:
+        if _journal.snapshot_due():
+            await asyncio.to_thread(_journal.snapshot, _cache_get(0))
 
-        time.sleep(600)  # check every 10 minutes
 
+async def _sync_once():
+    """Push the local state (rebased if JSONBin moved) and mark it synced."""
+    r = await async_retry_call(lambda: _async_request("GET"), retries=READ_RETRIES)
+    if r.status_code != 200:
+        raise RuntimeError("❌ ERROR reading JSONBin")
+    remote = r.json()["record"]
+
+    async with _local_lock:
+        entries = _journal.pending()
+        if not entries:
+            return
+
+        conflicts = []
+        if doc_version(remote) == _sync_state["remote_version"]:
+            merged = _cache_get(0)
+        else:
+            merged = copy.deepcopy(remote)
+            conflicts = rebase(merged, entries)
+            for seq, d, i, _ in conflicts:
+                CONFLICTS.inc(type="journal")
+                print(f"⚠️ Journal conflict: seq {seq} lost {d}[{i}] to a concurrent write")
+        merged["version"] = doc_version(remote) + 1
+        _cache_store(merged)
+
+    r = await async_retry_rate_limited(
+        lambda: _async_request("PUT", json=merged), WRITE_DEADLINE
+    )
+    if r.status_code != 200:
+        raise RuntimeError("❌ ERROR writing JSONBin")
+
+    if VERIFY_WRITES and not await _sync_landed(remote, merged):
+        # دور بعد روی سند تازه rebase می‌شود
+        CONFLICTS.inc(type="lost_write")
+        print("⚠️ Journal sync was overwritten, rebasing")
+        _sync_state["remote_version"] = None
+        return
 
-# Launch auto reset in background
-threading.Thread(target=auto_reset_worker, daemon=True).start()
+    _sync_state["remote_version"] = merged["version"]
+    await asyncio.to_thread(_journal.mark_synced, entries[-1]["seq"], conflicts)
+    _report_lost(entries, conflicts)
+
+
+async def async_refresh():
+    """
+    Pull the document from JSONBin. In journal mode it replaces the
+    local state only when nothing is pending; otherwise the next sync
+    rebases the pending entries onto it.
+    """
+    if _journal is None:
+        return await async_get_data(max_age=0, allow_stale=False)
+
+    r = await async_retry_call(lambda: _async_request("GET"), retries=READ_RETRIES)
+    if r.status_code != 200:
+        raise RuntimeError("❌ ERROR reading JSONBin")
+    remote = r.json()["record"]
+
+    async with _local_lock:
+        if _journal.pending():
+            _schedule_sync()
+            return _cache_get(0)
+        _cache_store(remote)
+        _sync_state["remote_version"] = doc_version(remote)
+        await asyncio.to_thread(_journal.snapshot, remote)
+    return copy.deepcopy(remote)
+
+
+def _schedule_refresh():
+    async def refresh():
+        try:
+            await async_refresh()
+        except Exception as e:
+            print("❌ Journal refresh error:", e)
+
+    _sync_state["refresh"] = asyncio.get_running_loop().create_task(refresh())
+
+
+async def _final_sync(deadline):
+    """Shutdown: push pending journal entries, waiting at most deadline seconds."""
+    if _journal is None or not _journal.pending():
+        return
+
+    _schedule_sync()
+    task = _sync_state["task"]
+    try:
+        await asyncio.wait_for(asyncio.shield(task), deadline)
+    except asyncio.TimeoutError:
+        task.cancel()
+        print(f"⚠️ {len(_journal.pending())} journal entries not synced at shutdown")
+
+
+def _report_lost(entries, conflicts):
+    """Tell the owner (on_lost) about every booking that lost its cell in rebase()."""
+    by_seq = {e["seq"]: e for e in entries}
+    for seq, d, i, _ in conflicts:
+        for cd, ci, _, new in by_seq[seq].get("cells", []):
+            if (cd, ci) == (d, i) and isinstance(new, dict) and "id" in new:
+                _fire("on_lost", new["id"], d, i)
+
+
+async def _sync_landed(remote, merged):
+    """Read the bin back and check our changes over remote are still there."""
+    r = await async_retry_call(lambda: _async_request("GET"), retries=READ_RETRIES)
+    if r.status_code != 200:
+        return False
+    return _write_landed(r.json()["record"], diff_doc(remote, merged))
 
 
 # ============================================================
-#  RESERVE
+#  AUTO RESET LOGIC
 # ============================================================
-def reserve(day, slot, full_name, telegram_id):
-    """Reserve a slot (0,1,2) for a day."""
-    data = get_data()
+def need_reset(data):
+    """Return True if the week was not reset since the last Friday midnight."""
+    return is_reset_due(data.get("last_reset", ""))
+
 
-    # اگر لازم است reset انجام شود (جمعه نیمه شب)
-    if need_reset(data):
-        reset_reservations()
-        data = get_data()
+def _clear_week(data):
+    """Replace data in place with an empty week and return the old one."""
+    previous = copy.deepcopy(data)
+    data.clear()
+    data.update(empty_week())
+    print("🧹 RESET: all reservations cleared.")
+    return previous
 
-    if day not in data:
-        return False, "❌ روز وارد شده معتبر نیست."
 
-    # ساختار را تضمین می‌کنیم
-    if not isinstance(data[day], list) or len(data[day]) != CAPACITY:
-        data[day] = [False] * CAPACITY
+def _reset_op(only_if_due):
+    def op(data):
+        # op ممکن است روی نسخهٔ تازه‌تر دوباره اجرا شود؛ فقط آخرین اجرا مهم است
+        op.previous = None
+        if only_if_due and not need_reset(data):
+            return False, False
+        op.previous = _clear_week(data)
+        return True, True
+    op.kind = "reset"
+    return op
 
-    if slot < 0 or slot >= CAPACITY:
-        return False, "❌ بازه زمانی نامعتبر است."
 
-    # اگر اسلات پر باشد
-    if data[day][slot] not in (False, None):
-        return False, "❌ این بازه قبلاً رزرو شده است."
+def _count_reset(done):
+    if done:
+        RESETS.inc()
+    return done
 
-    # ذخیره
-    data[day][slot] = {
-        "name": full_name,
-        "id": telegram_id
-    }
 
-    save_data(data)
-    return True, "✅ رزرو با موفقیت ثبت شد."
+async def async_reset_reservations():
+    """Reset all daily reservations."""
+    return _count_reset(await _batcher.submit(_reset_op(only_if_due=False)))
+
+
+async def async_reset_if_due():
+    """Reset only if need_reset(); safe to call from several places at once."""
+    return _count_reset(await _batcher.submit(_reset_op(only_if_due=True)))
+
+
+# ============================================================
+#  RESERVE
+# ============================================================
+def _reserve_op(day, slot, full_name, telegram_id):
+    def op(data):
+        # اگر لازم است reset انجام شود (جمعه نیمه شب)
+        op.previous = None
+        was_reset = need_reset(data)
+        if was_reset:
+            op.previous = _clear_week(data)
+
+        ok, msg = apply_reserve(data, day, slot, full_name, telegram_id)
+        return ok or was_reset, (ok, msg)
+    op.kind = "reserve"
+    return op
+
+
+def _count_reserve(result):
+    ok, msg = result
+    if ok:
+        BOOKINGS.inc()
+    elif msg == MSG_SLOT_TAKEN:
+        CONFLICTS.inc(type="slot_taken")
+    return result
+
+
+@timed(STORAGE_SECONDS, op="reserve")
+async def async_reserve(day, slot, full_name, telegram_id):
+    """Reserve a slot (0,1,2) for a day; coalesced with concurrent writes."""
+    return _count_reserve(
+        await _batcher.submit(_reserve_op(day, slot, full_name, telegram_id))
+    )
 
 
 # ============================================================
 #  CANCEL
 # ============================================================
-def cancel_reservation(telegram_id):
-    """Remove ALL reservations for this user."""
-    data = get_data()
-    removed = False
-
-    days = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه",
-            "چهارشنبه", "پنجشنبه", "جمعه"]
-
-    for d in days:
-        if isinstance(data.get(d), list):
-            for i in range(CAPACITY):
-                cell = data[d][i]
-                if isinstance(cell, dict) and cell.get("id") == telegram_id:
-                    data[d][i] = False
-                    removed = True
-
-    if removed:
-        save_data(data)
-        return True, "🔄 رزرو شما لغو شد."
-    else:
-        return False, "❌ رزروی برای شما یافت نشد."
+def _cancel_op(telegram_id, day=None, slot=None):
+    def op(data):
+        # خانه‌ها از همین سند ساخته می‌شوند، نه از کش: رزرو همین کاربر
+        # در همان دسته ادغام‌شده هم دیده می‌شود
+        if day is not None:
+            cells = [(day, slot)]
+        else:
+            cells = build_index(data).get(telegram_id, [])
+
+        if apply_cancel(data, telegram_id, cells):
+            return True, (True, MSG_CANCELLED)
+        return False, (False, MSG_NOT_FOUND)
+    op.kind = "cancel"
+    return op
+
+
+@timed(STORAGE_SECONDS, op="cancel_reservation")
+async def async_cancel_reservation(telegram_id, day=None, slot=None):
+    """Remove this user's reservation at (day, slot), or ALL of them."""
+    return await _batcher.submit(_cancel_op(telegram_id, day, slot))
+
+
+async def async_availability():
+    """
+    Return {day: [free slots]} from memory. Only a cold cache costs a
+    read; a stale one is fine since reserve() re-checks the slot.
+    """
+    view = cached_availability()
+    if view is None:
+        await async_get_data()
+        view = cached_availability()
+    return view
+
+
+async def async_user_reservations(telegram_id):
+    """Return [(day, slot), ...] held by this user."""
+    await async_get_data()
+    return user_cells(telegram_id)
+
+
+# ============================================================
+#  STORAGE BACKEND
+# ============================================================
+_owner = None  # JsonBinStorage که هوک‌هایش از کد این ماژول صدا زده می‌شوند
+
+
+def _fire(hook_name, *args):
+    if _owner is not None:
+        _owner._fire(getattr(_owner, hook_name), *args)
+
+
+class JsonBinStorage(Storage):
+    """Whole-document storage on JSONBin (the original behaviour)."""
+
+    def __init__(self):
+        global _owner
+        _owner = self
+
+    async def load(self):
+        return await async_get_data()
+
+    async def reserve(self, day, slot, full_name, telegram_id):
+        return await async_reserve(day, slot, full_name, telegram_id)
+
+    async def cancel(self, telegram_id, day=None, slot=None):
+        return await async_cancel_reservation(telegram_id, day, slot)
+
+    async def user_reservations(self, telegram_id):
+        return await async_user_reservations(telegram_id)
+
+    async def reset_week(self):
+        return await async_reset_reservations()
+
+    async def reset_if_due(self):
+        if need_reset(await async_get_data()):
+            return await async_reset_if_due()
+        return False
+
+    async def availability(self):
+        return await async_availability()
+
+    async def close(self):
+        await _final_sync(SHUTDOWN_SYNC_DEADLINE)
+        await aclose()
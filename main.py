@@ -3,9 +3,16 @@ import logging
 import threading
 import asyncio
 from flask import Flask, request
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import (
+    Update,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+)
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     ContextTypes,
@@ -13,7 +20,13 @@ from telegram.ext import (
     filters,
 )
 
-from jsonbin import reserve, cancel_reservation
+from booking import DAYS, CAPACITY, SLOT_LABELS, MSG_NOT_FOUND, MSG_UNAVAILABLE
+from storage import get_storage, StorageUnavailable
+from scheduler import start_weekly_reset
+from dispatch import UpdateQueue
+from notify import Notifier
+import metrics
+from metrics import HANDLER_SECONDS, WEBHOOK_SECONDS, timed
 
 # ------------------------------------------------
 # logging
@@ -31,9 +44,16 @@ RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
 if not TOKEN or not RENDER_EXTERNAL_URL:
     raise RuntimeError("❌ ENV values missing: TOKEN / RENDER_EXTERNAL_URL")
 
+# فقط برای بنچمارک: آدرس جایگزین Bot API (bench/fake_telegram.py)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")
+
 WEBHOOK_PATH = f"/{TOKEN}"
 WEBHOOK_URL = f"{RENDER_EXTERNAL_URL}{WEBHOOK_PATH}"
 
+# asgi: وب‌سرور async روی همان loop ربات | flask: مسیر قدیمی
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "asgi").lower()
+RETRY_AFTER = 1  # ثانیه؛ برای پاسخ 503 هنگام پر بودن صف
+
 
 # ------------------------------------------------
 # Flask
@@ -44,7 +64,11 @@ app = Flask(__name__)
 # ------------------------------------------------
 # Telegram
 # ------------------------------------------------
-application = Application.builder().token(TOKEN).build()
+builder = Application.builder().token(TOKEN)
+if TELEGRAM_BASE_URL:
+    builder = builder.base_url(f"{TELEGRAM_BASE_URL}/bot")
+application = builder.build()
+storage = get_storage()
 
 FULLNAME, DAY, SLOT = range(3)
 
@@ -52,27 +76,36 @@ FULLNAME, DAY, SLOT = range(3)
 # ------------------------------------------------
 # Bot Functions
 # ------------------------------------------------
+@timed(HANDLER_SECONDS, handler="start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "سلام 👋\n"
         "برای رزرو: /reserve\n"
+        "رزروهای من: /my_reservations\n"
         "برای لغو رزرو: /cancel_reserve\n"
     )
 
 
+@timed(HANDLER_SECONDS, handler="reserve_start")
 async def reserve_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("نام و نام خانوادگی را وارد کنید:")
     return FULLNAME
 
 
+@timed(HANDLER_SECONDS, handler="ask_day")
 async def ask_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["full_name"] = update.message.text.strip()
 
-    keyboard = [
-        ["شنبه", "یکشنبه", "دوشنبه"],
-        ["سه‌شنبه", "چهارشنبه", "پنجشنبه"],
-        ["جمعه"],
-    ]
+    free = await storage.availability()
+    days = [d for d in DAYS if free.get(d)]
+
+    if not days:
+        await update.message.reply_text(
+            "❌ همه بازه‌های این هفته پر شده است.", reply_markup=ReplyKeyboardRemove()
+        )
+        return ConversationHandler.END
+
+    keyboard = [days[i:i + 3] for i in range(0, len(days), 3)]
 
     await update.message.reply_text(
         "روز موردنظر را انتخاب کنید:",
@@ -81,10 +114,17 @@ async def ask_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return DAY
 
 
+@timed(HANDLER_SECONDS, handler="ask_slot")
 async def ask_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["day"] = update.message.text.strip()
+    day = update.message.text.strip()
+
+    free = await storage.availability()
+    if not free.get(day):
+        await update.message.reply_text("❌ این روز معتبر نیست یا ظرفیت آن پر است.")
+        return DAY
 
-    keyboard = [["18-19", "19-20", "20-21"]]
+    context.user_data["day"] = day
+    keyboard = [[SLOT_LABELS[i] for i in free[day]]]
 
     await update.message.reply_text(
         "بازه زمانی را انتخاب کنید:",
@@ -93,8 +133,9 @@ async def ask_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return SLOT
 
 
+@timed(HANDLER_SECONDS, handler="reserve_done")
 async def reserve_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    slot_map = {"18-19": 0, "19-20": 1, "20-21": 2}
+    slot_map = {label: i for i, label in enumerate(SLOT_LABELS)}
     msg = update.message.text.strip()
 
     if msg not in slot_map:
@@ -106,18 +147,77 @@ async def reserve_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     full_name = context.user_data["full_name"]
     telegram_id = update.effective_user.id
 
-    ok, res = reserve(day, slot, full_name, telegram_id)
+    ok, res = await storage.reserve(day, slot, full_name, telegram_id)
     await update.message.reply_text(res, reply_markup=ReplyKeyboardRemove())
+    if ok:
+        notifier.remind_booking(telegram_id, day, slot)
 
     return ConversationHandler.END
 
 
+@timed(HANDLER_SECONDS, handler="cancel_reserve_cmd")
 async def cancel_reserve_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
-    ok, msg = cancel_reservation(telegram_id)
+    ok, msg = await storage.cancel(telegram_id)
     await update.message.reply_text(msg)
+    if ok:
+        notifier.forget(telegram_id)
+
+
+@timed(HANDLER_SECONDS, handler="my_reservations_cmd")
+async def my_reservations_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    telegram_id = update.effective_user.id
+    cells = await storage.user_reservations(telegram_id)
+
+    if not cells:
+        await update.message.reply_text(MSG_NOT_FOUND)
+        return
+
+    lines = ["📋 رزروهای شما:"]
+    buttons = []
+    for day, slot in cells:
+        lines.append(f"• {day} {SLOT_LABELS[slot]}")
+        buttons.append([InlineKeyboardButton(
+            f"❌ لغو {day} {SLOT_LABELS[slot]}",
+            callback_data=f"cancel:{DAYS.index(day)}:{slot}",
+        )])
+
+    await update.message.reply_text(
+        "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup(buttons),
+    )
+
 
+@timed(HANDLER_SECONDS, handler="cancel_slot_cb")
+async def cancel_slot_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
 
+    _, day_idx, slot = query.data.split(":")
+    day_idx, slot = int(day_idx), int(slot)
+    if day_idx >= len(DAYS) or slot >= CAPACITY:
+        return
+    day = DAYS[day_idx]
+
+    ok, msg = await storage.cancel(update.effective_user.id, day, slot)
+    if ok:
+        notifier.forget(update.effective_user.id, day, slot)
+        msg = f"{msg} ({day} {SLOT_LABELS[slot]})"
+    await query.edit_message_text(msg)
+
+
+async def on_error(update, context: ContextTypes.DEFAULT_TYPE):
+    """Storage outages get a short reply; anything else is logged."""
+    if isinstance(context.error, StorageUnavailable):
+        logger.warning("⚠️ Storage unavailable: %s", context.error)
+        if isinstance(update, Update) and update.effective_message:
+            await update.effective_message.reply_text(MSG_UNAVAILABLE)
+        return
+
+    logger.error("❌ HANDLER ERROR", exc_info=context.error)
+
+
+@timed(HANDLER_SECONDS, handler="cancel")
 async def cancel(update, context):
     await update.message.reply_text("لغو شد ✅", reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
@@ -139,10 +239,123 @@ conv = ConversationHandler(
 application.add_handler(conv)
 application.add_handler(CommandHandler("start", start))
 application.add_handler(CommandHandler("cancel_reserve", cancel_reserve_cmd))
+application.add_handler(CommandHandler("my_reservations", my_reservations_cmd))
+application.add_handler(CallbackQueryHandler(cancel_slot_cb, pattern=r"^cancel:\d+:\d+$"))
+application.add_error_handler(on_error)
 
 
 # ------------------------------------------------
-# ASYNC LOOP
+# UPDATE QUEUE
+# ------------------------------------------------
+updates = UpdateQueue(application)
+
+notifier = Notifier(application.bot, busy=lambda: updates.in_flight > 0)
+storage.on_lost = notifier.booking_lost
+storage.on_reset = notifier.announce_reset
+
+# task حلقه reset هفتگی؛ در shutdown لغو می‌شود
+background_tasks: list[asyncio.Task] = []
+
+metrics.Gauge(
+    "laundry_updates_in_flight", "Updates queued or being processed.",
+    fn=lambda: updates.in_flight,
+)
+
+
+async def startup():
+    """Start Telegram App + Webhook + background tasks (on the bot loop)"""
+    await application.initialize()
+
+    info = await application.bot.get_webhook_info()
+    if info.url != WEBHOOK_URL:
+        await application.bot.delete_webhook()
+        await application.bot.set_webhook(WEBHOOK_URL)
+
+    await application.start()
+    await updates.start()
+    await notifier.start()
+    notifier.start_rebuild(storage.load)
+    background_tasks.append(start_weekly_reset(storage))
+
+    logger.info("✅ BOT READY | Webhook → %s", WEBHOOK_URL)
+
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+    await updates.stop()
+    await notifier.stop()
+    await application.stop()
+    await application.shutdown()
+    await storage.close()
+
+
+def parse_update(data):
+    return Update.de_json(data, application.bot)
+
+
+# ------------------------------------------------
+# ASGI (default) — همه چیز روی یک event loop
+# ------------------------------------------------
+def build_asgi_app():
+    """Starlette app sharing the Application's event loop."""
+    # import تنبل: حالت flask بدون این وابستگی‌ها هم اجرا می‌شود
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+
+    @timed(WEBHOOK_SECONDS, server="asgi")
+    async def asgi_webhook(request):
+        """Telegram → ASGI"""
+        try:
+            update = parse_update(await request.json())
+        except Exception as e:
+            logger.exception("❌ WEBHOOK ERROR: %s", e)
+            return PlainTextResponse("ok")
+
+        if not updates.offer(update):
+            return PlainTextResponse(
+                "busy", status_code=503, headers={"Retry-After": str(RETRY_AFTER)}
+            )
+        return PlainTextResponse("ok")
+
+    async def asgi_index(request):
+        return PlainTextResponse("✅ Bot Running")
+
+    async def asgi_metrics(request):
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        await startup()
+        try:
+            yield
+        finally:
+            await shutdown()
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, asgi_webhook, methods=["POST"]),
+            Route("/", asgi_index),
+            Route("/metrics", asgi_metrics),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def run_asgi(port):
+    import uvicorn
+
+    logger.info("ASGI server running on port %d", port)
+    uvicorn.run(build_asgi_app(), host="0.0.0.0", port=port, log_level="info")
+
+
+# ------------------------------------------------
+# FLASK (fallback) — ASYNC LOOP در یک thread جدا
 # ------------------------------------------------
 tg_loop: asyncio.AbstractEventLoop | None = None
 
@@ -155,7 +368,8 @@ def run_loop():
     tg_loop.run_forever()
 
 
-threading.Thread(target=run_loop, name="tg-loop", daemon=True).start()
+if WEBHOOK_MODE == "flask":
+    threading.Thread(target=run_loop, name="tg-loop", daemon=True).start()
 
 
 def submit(coro):
@@ -177,33 +391,27 @@ def wait_for_loop():
 
 def bootstrap():
     """Start Telegram App + Webhook"""
-    submit(application.initialize()).result()
-
-    async def setup_webhook():
-        info = await application.bot.get_webhook_info()
-        if info.url != WEBHOOK_URL:
-            await application.bot.delete_webhook()
-            await application.bot.set_webhook(WEBHOOK_URL)
+    submit(startup()).result()
 
-    submit(setup_webhook()).result()
-    submit(application.start()).result()
 
-    logger.info("✅ BOT READY | Webhook → %s", WEBHOOK_URL)
+async def _offer(update):
+    return updates.offer(update)
 
 
-# ------------------------------------------------
-# WEBHOOK ROUTES
-# ------------------------------------------------
 @app.route(WEBHOOK_PATH, methods=["POST"])
+@timed(WEBHOOK_SECONDS, server="flask")
 def webhook():
     """Telegram → Flask"""
     try:
         data = request.get_json(force=True)
-        update = Update.de_json(data, application.bot)
-        submit(application.process_update(update))
+        update = parse_update(data)
+        accepted = submit(_offer(update)).result(timeout=5)
     except Exception as e:
         logger.exception("❌ WEBHOOK ERROR: %s", e)
+        return "ok", 200
 
+    if not accepted:
+        return "busy", 503, {"Retry-After": str(RETRY_AFTER)}
     return "ok", 200
 
 
@@ -212,15 +420,24 @@ def index():
     return "✅ Bot Running", 200
 
 
+@app.route("/metrics")
+def metrics_route():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
 # ------------------------------------------------
 # MAIN
 # ------------------------------------------------
 if __name__ == "__main__":
-    if wait_for_loop():
-        bootstrap()
+    port = int(os.getenv("PORT", 5000))
+
+    if WEBHOOK_MODE == "asgi":
+        run_asgi(port)
     else:
-        raise RuntimeError("❌ Event loop failed to start")
+        if wait_for_loop():
+            bootstrap()
+        else:
+            raise RuntimeError("❌ Event loop failed to start")
 
-    port = int(os.getenv("PORT", 5000))
-    logger.info("Flask running on port %d", port)
-    app.run(host="0.0.0.0", port=port)
+        logger.info("Flask running on port %d", port)
+        app.run(host="0.0.0.0", port=port)
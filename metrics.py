@@ -0,0 +1,177 @@
+import time
+import asyncio
+import functools
+import threading
+from collections import deque
+
+# ============================================================
+#  PRIMITIVES
+#  خروجی با فرمت متنی Prometheus؛ بدون وابستگی خارجی
+# ============================================================
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 1024  # تعداد آخرین نمونه‌ها برای محاسبه صدک‌ها
+
+REGISTRY = []
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labelnames=()):
+        super().__init__(name, doc, labelnames)
+        self._values = {}
+
+    def inc(self, n=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A gauge read from fn() at scrape time, or set explicitly."""
+
+    kind = "gauge"
+
+    def __init__(self, name, doc, fn=None):
+        super().__init__(name, doc)
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def _samples(self):
+        value = self.fn() if self.fn is not None else self.value
+        return [f"{self.name} {value}"]
+
+
+class Summary(_Metric):
+    """Latency summary: p50/p95/p99 over the last WINDOW samples, plus sum/count."""
+
+    kind = "summary"
+
+    def __init__(self, name, doc, labelnames=()):
+        super().__init__(name, doc, labelnames)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [deque(maxlen=WINDOW), 0.0, 0]
+            series[0].append(value)
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, sorted(s[0]), s[1], s[2]) for k, s in self._series.items()]
+
+        lines = []
+        for key, window, total, count in items:
+            for q in QUANTILES:
+                value = window[min(len(window) - 1, int(q * len(window)))] if window else 0
+                labels = _labels(self.labelnames, key, f'quantile="{q}"')
+                lines.append(f"{self.name}{labels} {value:.6f}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, summary, labels):
+        self.summary = summary
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.summary.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timed(summary, **labels):
+    """Decorator timing a sync or async function into summary."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with summary.time(**labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with summary.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ============================================================
+#  METRICS
+# ============================================================
+STORAGE_SECONDS = Summary(
+    "laundry_storage_call_seconds", "Latency of storage calls.", ["op"]
+)
+HANDLER_SECONDS = Summary(
+    "laundry_handler_seconds", "Latency of Telegram handlers.", ["handler"]
+)
+WEBHOOK_SECONDS = Summary(
+    "laundry_webhook_seconds", "Time to accept a webhook POST.", ["server"]
+)
+
+BOOKINGS = Counter("laundry_bookings_total", "Successful reservations.")
+CONFLICTS = Counter(
+    "laundry_conflicts_total", "Slot-taken answers and document version conflicts.", ["type"]
+)
+RETRIES = Counter("laundry_storage_retries_total", "Retried storage calls (reads, and writes after a 429).")
+RESETS = Counter("laundry_resets_total", "Weekly resets performed.")
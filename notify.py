@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from datetime import timedelta
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from booking import SLOT_LABELS, build_index, slot_start
+from ratelimit import KeyedBuckets, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------
+# ENV
+# ------------------------------------------------
+# سقف تلگرام ~30 پیام/ثانیه کلی و ~1 پیام/ثانیه برای هر چت است؛
+# پیام‌های انبوه کمتر از سقف کلی مصرف می‌کنند تا پاسخ‌های تعاملی جا داشته باشند
+BULK_RATE = float(os.getenv("NOTIFY_BULK_RATE", "20"))
+CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+REMIND_BEFORE = timedelta(minutes=float(os.getenv("REMIND_BEFORE_MIN", "60")))
+REMINDERS_PATH = os.getenv("REMINDERS_PATH", "reminders.json")
+
+# هنگام رسیدگی به update‌ها، ارسال انبوه حداکثر BUSY_MAX_WAIT عقب می‌کشد
+BUSY_YIELD = 0.05
+BUSY_MAX_WAIT = 1.0
+
+# بازسازی یادآوری‌ها هنگام شروع، در صورت در دسترس نبودن ذخیره‌ساز
+REBUILD_RETRY_DELAY = 60
+
+PRIORITY_REMINDER = 1
+PRIORITY_BROADCAST = 2
+
+MSG_REMINDER = "⏰ یادآوری: نوبت شما {day} ساعت {label} است."
+MSG_WEEK_OPEN = "🧺 رزروهای هفته جدید باز شد! برای رزرو: /reserve"
+MSG_BOOKING_LOST = (
+    "⚠️ متأسفانه نوبت {day} ساعت {label} هم‌زمان توسط فرد دیگری ثبت شد "
+    "و رزرو شما لغو شد. برای رزرو دوباره: /reserve"
+)
+
+
+# ------------------------------------------------
+# Reminder store
+# ------------------------------------------------
+class ReminderStore:
+    """Scheduled reminders persisted as JSON so they survive restarts."""
+
+    def __init__(self, path=REMINDERS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.items = {}  # key -> {"chat_id", "at", "text"}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.items = json.load(f)
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def put(self, key, chat_id, at, text):
+        with self._lock:
+            self.items[key] = {"chat_id": chat_id, "at": at, "text": text}
+            self._save()
+
+    def drop(self, match):
+        """Remove every reminder whose key satisfies match(key)."""
+        with self._lock:
+            keys = [k for k in self.items if match(k)]
+            for k in keys:
+                del self.items[k]
+            if keys:
+                self._save()
+
+    def pop_due(self, now):
+        with self._lock:
+            due = [(k, v) for k, v in self.items.items() if v["at"] <= now]
+            for k, _ in due:
+                del self.items[k]
+            if due:
+                self._save()
+            return [v for _, v in due]
+
+    def next_at(self):
+        with self._lock:
+            return min((v["at"] for v in self.items.values()), default=None)
+
+
+def reminder_key(chat_id, day, slot):
+    return f"{chat_id}:{day}:{slot}"
+
+
+# ------------------------------------------------
+# Notifier
+# ------------------------------------------------
+class Notifier:
+    """
+    Async bulk sender for reminders and broadcasts.
+
+    Messages wait in a priority queue and leave through a global token
+    bucket (BULK_RATE/s) and a per-chat bucket (CHAT_RATE/s). A 429
+    pauses the sender for retry_after and re-queues the message. While
+    busy() is true (updates in flight) each send yields first, so
+    interactive replies keep priority.
+    """
+
+    def __init__(self, bot, busy=None, store=None):
+        self.bot = bot
+        self.busy = busy or (lambda: False)
+        self.store = store or ReminderStore()
+        self.global_bucket = TokenBucket(BULK_RATE, BULK_RATE)
+        self.chat_buckets = KeyedBuckets(CHAT_RATE, 1)
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._sender(), name="notify-sender"),
+            asyncio.create_task(self._reminder_loop(), name="notify-reminders"),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --------------------------------------------
+    # enqueue
+    # --------------------------------------------
+    def send(self, chat_id, text, priority=PRIORITY_BROADCAST, attempt=0):
+        self._queue.put_nowait((priority, next(self._seq), chat_id, text, attempt))
+
+    def broadcast(self, chat_ids, text):
+        for chat_id in chat_ids:
+            self.send(chat_id, text)
+        logger.info("📣 Broadcast queued for %d chats", len(chat_ids))
+
+    # --------------------------------------------
+    # reminders
+    # --------------------------------------------
+    def remind_booking(self, chat_id, day, slot):
+        """Schedule a reminder REMIND_BEFORE the slot starts (if still ahead)."""
+        at = (slot_start(day, slot) - REMIND_BEFORE).timestamp()
+        if at <= time.time():
+            return
+        text = MSG_REMINDER.format(day=day, label=SLOT_LABELS[slot])
+        self.store.put(reminder_key(chat_id, day, slot), chat_id, at, text)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def forget(self, chat_id, day=None, slot=None):
+        """Drop reminders for a cancelled slot, or all of a user's."""
+        if day is not None:
+            key = reminder_key(chat_id, day, slot)
+            self.store.drop(lambda k: k == key)
+        else:
+            prefix = f"{chat_id}:"
+            self.store.drop(lambda k: k.startswith(prefix))
+
+    async def booking_lost(self, chat_id, day, slot):
+        """Storage on_lost hook: drop the reminder and tell the user."""
+        self.forget(chat_id, day, slot)
+        text = MSG_BOOKING_LOST.format(day=day, label=SLOT_LABELS[slot])
+        self.send(chat_id, text, PRIORITY_REMINDER)
+
+    def sync_reminders(self, data):
+        """Fan out reminders for every booking in a reservation document."""
+        for chat_id, cells in build_index(data).items():
+            for day, slot in cells:
+                self.remind_booking(chat_id, day, slot)
+
+    def start_rebuild(self, load):
+        """Run sync_reminders(await load()) in the background until it succeeds."""
+        self._tasks.append(asyncio.create_task(
+            self._rebuild_loop(load), name="notify-rebuild"
+        ))
+
+    async def _rebuild_loop(self, load):
+        # مثل weekly_reset_loop: خطای ذخیره‌ساز راه‌اندازی ربات را متوقف نمی‌کند
+        while True:
+            try:
+                self.sync_reminders(await load())
+                return
+            except Exception as e:
+                logger.warning("⚠️ Reminder rebuild failed, retrying in %ss: %s",
+                               REBUILD_RETRY_DELAY, e)
+                await asyncio.sleep(REBUILD_RETRY_DELAY)
+
+    async def announce_reset(self, previous):
+        """on_reset hook: clear reminders and tell last week's users."""
+        self.store.drop(lambda k: True)
+        chat_ids = list(build_index(previous or {}).keys())
+        self.broadcast(chat_ids, MSG_WEEK_OPEN)
+
+    async def _reminder_loop(self):
+        while True:
+            self._wakeup.clear()
+            for item in self.store.pop_due(time.time()):
+                self.send(item["chat_id"], item["text"], PRIORITY_REMINDER)
+
+            next_at = self.store.next_at()
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # --------------------------------------------
+    # sender
+    # --------------------------------------------
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, chat_id, text, attempt = await self._queue.get()
+
+            # محدودیت هر چت: به‌جای انتظار، پیام برای بعد زمان‌بندی می‌شود
+            chat_delay = self.chat_buckets.get(chat_id).delay()
+            if chat_delay > 0:
+                loop.call_later(chat_delay, self.send, chat_id, text, priority, attempt)
+                continue
+
+            waited = 0.0
+            while self.busy() and waited < BUSY_MAX_WAIT:
+                await asyncio.sleep(BUSY_YIELD)
+                waited += BUSY_YIELD
+            while not self.global_bucket.try_acquire():
+                await asyncio.sleep(self.global_bucket.delay())
+            self.chat_buckets.try_acquire(chat_id)
+
+            try:
+                await self.bot.send_message(chat_id, text)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning("⚠️ Telegram flood limit, pausing %ss", retry_after)
+                self.send(chat_id, text, priority, attempt)
+                await asyncio.sleep(float(retry_after))
+            except Forbidden:
+                logger.info("Chat %s blocked the bot; skipped", chat_id)
+            except TelegramError as e:
+                if attempt + 1 < MAX_ATTEMPTS:
+                    loop.call_later(2 ** attempt, self.send, chat_id, text, priority, attempt + 1)
+                else:
+                    logger.warning("❌ Notification to %s dropped: %s", chat_id, e)
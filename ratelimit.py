@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+
+
+# ------------------------------------------------
+# Token bucket
+# ------------------------------------------------
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, n=1):
+        """Take n tokens if available. Returns False (and takes none) otherwise."""
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def delay(self, n=1):
+        """Seconds until n tokens will be available."""
+        self._refill()
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+
+class KeyedBuckets:
+    """One TokenBucket per key, keeping only the `maxkeys` most recent keys."""
+
+    def __init__(self, rate, capacity, maxkeys=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.maxkeys = maxkeys
+        self._buckets: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.maxkeys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key, n=1):
+        return self.get(key).try_acquire(n)
+
+
+# ------------------------------------------------
+# Recently seen ids
+# ------------------------------------------------
+class RecentIds:
+    """Bounded LRU set whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=5000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._seen: OrderedDict = OrderedDict()
+
+    def _expire(self, now):
+        while self._seen:
+            key, ts = next(iter(self._seen.items()))
+            if now - ts <= self.ttl:
+                break
+            self._seen.popitem(last=False)
+
+    def __contains__(self, key):
+        self._expire(time.monotonic())
+        return key in self._seen
+
+    def add(self, key):
+        now = time.monotonic()
+        self._expire(now)
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
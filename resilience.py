@@ -0,0 +1,122 @@
+import random
+import asyncio
+import threading
+import time
+
+from metrics import RETRIES
+from storage import StorageUnavailable
+
+
+# ============================================================
+#  CIRCUIT BREAKER
+# ============================================================
+class CircuitOpenError(StorageUnavailable):
+    """Raised without touching the network while the breaker is open."""
+
+
+class RateLimited(StorageUnavailable):
+    """The backend answered 429; nothing was done and retry_after says when to retry."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    closed → open after `threshold` consecutive failures; after
+    `reset_timeout` seconds one trial call is let through (half-open)
+    and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, name="storage"):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial:
+                raise CircuitOpenError(f"❌ {self.name} circuit open")
+            self._trial = True  # half-open: فقط یک درخواست آزمایشی
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"✅ {self.name} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_throttled(self):
+        """A 429: the backend is up but busy, so it is neither success nor failure."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None or self._trial:
+                    print(f"⚠️ {self.name} circuit open")
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+# ============================================================
+#  RETRIES
+#  فقط برای عملیات idempotent (خواندن)؛ جز 429 که یعنی چیزی انجام نشده
+# ============================================================
+def backoff_delay(attempt, base=0.2, cap=2.0):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_delay(e, attempt, base, cap):
+    delay = backoff_delay(attempt, base, cap)
+    if isinstance(e, RateLimited):
+        delay = max(delay, e.retry_after)
+    return delay
+
+
+async def async_retry_call(fn, retries=2, base=0.2, cap=2.0):
+    """Await fn(), retrying StorageUnavailable (but not an open circuit)."""
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except CircuitOpenError:
+            raise
+        except StorageUnavailable as e:
+            if attempt == retries:
+                raise
+            RETRIES.inc()
+            await asyncio.sleep(_retry_delay(e, attempt, base, cap))
+
+
+async def async_retry_rate_limited(fn, deadline):
+    """
+    Await fn(), retrying only RateLimited after its retry_after, as long
+    as the next attempt still starts within `deadline` seconds. Safe for
+    writes: a 429 means the request was not applied.
+    """
+    start = time.monotonic()
+    while True:
+        try:
+            return await fn()
+        except RateLimited as e:
+            if time.monotonic() - start + e.retry_after > deadline:
+                raise
+            RETRIES.inc()
+            await asyncio.sleep(e.retry_after)
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+from booking import now_tehran, next_reset_at
+
+logger = logging.getLogger(__name__)
+
+# حداکثر یک خواب طولانی؛ فقط ساعت دوباره محاسبه می‌شود، نه درخواست شبکه
+MAX_SLEEP = 3600
+RETRY_DELAY = 60
+
+
+# ------------------------------------------------
+# Weekly reset
+# ------------------------------------------------
+async def _sleep_until(when):
+    while True:
+        delay = (when - now_tehran()).total_seconds()
+        if delay <= 0:
+            return
+        await asyncio.sleep(min(delay, MAX_SLEEP))
+
+
+async def weekly_reset_loop(storage):
+    """
+    Reset the week at every Friday 00:00 Asia/Tehran.
+
+    The first pass runs immediately so a reset missed while the bot was
+    down is caught up; reset_if_due() makes repeated passes harmless.
+    Follow-ups (announcement, reminders) hang off storage.on_reset so they
+    also run when a booking performs the reset first.
+    """
+    while True:
+        try:
+            if await storage.reset_if_due():
+                logger.info("🧹 Weekly reset done")
+        except Exception as e:
+            logger.exception("❌ Weekly reset error: %s", e)
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+
+        when = next_reset_at()
+        logger.info("⏰ Next weekly reset at %s", when.isoformat())
+        await _sleep_until(when)
+
+
+def start_weekly_reset(storage):
+    """Schedule weekly_reset_loop on the running loop and return its task."""
+    return asyncio.get_running_loop().create_task(
+        weekly_reset_loop(storage), name="weekly-reset"
+    )
@@ -0,0 +1,248 @@
+import os
+import asyncio
+import sqlite3
+import threading
+
+from booking import (
+    CAPACITY,
+    DAYS,
+    MSG_INVALID_DAY,
+    MSG_INVALID_SLOT,
+    MSG_SLOT_TAKEN,
+    MSG_RESERVED,
+    MSG_CANCELLED,
+    MSG_NOT_FOUND,
+    today_str,
+    is_reset_due,
+)
+from metrics import STORAGE_SECONDS, BOOKINGS, CONFLICTS, RESETS, timed
+from storage import Storage
+
+# ============================================================
+#  LOAD ENV
+# ============================================================
+SQLITE_PATH = os.getenv("SQLITE_PATH", "reservations.db")
+
+
+# ============================================================
+#  SCHEMA
+#  هر رزرو یک سطر؛ کلید اصلی (day, slot) رزرو تکراری را غیرممکن می‌کند
+# ============================================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservations (
+    day         TEXT    NOT NULL,
+    slot        INTEGER NOT NULL,
+    full_name   TEXT    NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    PRIMARY KEY (day, slot)
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_telegram_id
+    ON reservations (telegram_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# ============================================================
+#  STORAGE BACKEND
+# ============================================================
+class SqliteStorage(Storage):
+    """Local SQLite storage: one row per booked (day, slot)."""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # نمای آزاد بودن اسلات‌ها؛ با هر تغییر پاک می‌شود
+        self._availability_view = None
+
+    # --------------------------------------------
+    # sync internals (run in a worker thread)
+    # --------------------------------------------
+    def _last_reset(self):
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'last_reset'"
+        ).fetchone()
+        return row[0] if row else ""
+
+    def _clear_week(self):
+        """
+        DELETE every booking and stamp last_reset; caller holds a transaction.
+        Returns the week as it was, for Storage.on_reset.
+        """
+        previous = self._week_doc()
+        self._conn.execute("DELETE FROM reservations")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) "
+            "VALUES ('last_reset', ?)",
+            (today_str(),),
+        )
+        return previous
+
+    def _count_reset(self):
+        RESETS.inc()
+        print("🧹 RESET: all reservations cleared.")
+
+    def _reset(self, only_if_due=False):
+        """Returns the previous week if the reset happened, else None."""
+        # بررسی موعد، DELETE و ثبت last_reset در یک تراکنش؛ در غیر این صورت
+        # reset دیرهنگام رزروی را که بین این دو ثبت شده پاک می‌کند
+        previous = None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not only_if_due or is_reset_due(self._last_reset()):
+                    previous = self._clear_week()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._availability_view = None
+        if previous is not None:
+            self._count_reset()
+        return previous
+
+    def _reset_if_due(self):
+        return self._reset(only_if_due=True)
+
+    def _reserve(self, day, slot, full_name, telegram_id):
+        """Returns ((ok, message), previous week if this call reset it)."""
+        if day not in DAYS:
+            return (False, MSG_INVALID_DAY), None
+        if slot < 0 or slot >= CAPACITY:
+            return (False, MSG_INVALID_SLOT), None
+
+        previous = None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # اگر لازم است reset انجام شود (جمعه نیمه شب)
+                if is_reset_due(self._last_reset()):
+                    previous = self._clear_week()
+                try:
+                    self._conn.execute(
+                        "INSERT INTO reservations (day, slot, full_name, telegram_id) "
+                        "VALUES (?, ?, ?, ?)",
+                        (day, slot, full_name, telegram_id),
+                    )
+                    taken = False
+                except sqlite3.IntegrityError:
+                    taken = True
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._availability_view = None
+
+        if previous is not None:
+            self._count_reset()
+        if taken:
+            CONFLICTS.inc(type="slot_taken")
+            return (False, MSG_SLOT_TAKEN), previous
+        BOOKINGS.inc()
+        return (True, MSG_RESERVED), previous
+
+    def _cancel(self, telegram_id, day=None, slot=None):
+        sql = "DELETE FROM reservations WHERE telegram_id = ?"
+        params = [telegram_id]
+        if day is not None:
+            sql += " AND day = ? AND slot = ?"
+            params += [day, slot]
+
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            if cur.rowcount:
+                self._availability_view = None
+        if cur.rowcount:
+            return True, MSG_CANCELLED
+        return False, MSG_NOT_FOUND
+
+    def _user_reservations(self, telegram_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, slot FROM reservations WHERE telegram_id = ?",
+                (telegram_id,),
+            ).fetchall()
+
+        return sorted(
+            ((d, i) for d, i in rows if d in DAYS),
+            key=lambda c: (DAYS.index(c[0]), c[1]),
+        )
+
+    def _week_doc(self):
+        """Build the JSONBin-shaped document; caller holds self._lock."""
+        data = {"last_reset": self._last_reset()}
+        for d in DAYS:
+            data[d] = [False] * CAPACITY
+
+        rows = self._conn.execute(
+            "SELECT day, slot, full_name, telegram_id FROM reservations"
+        ).fetchall()
+        for day, slot, full_name, telegram_id in rows:
+            if day in data and 0 <= slot < CAPACITY:
+                data[day][slot] = {"name": full_name, "id": telegram_id}
+        return data
+
+    def _load(self):
+        with self._lock:
+            return self._week_doc()
+
+    def _availability(self):
+        with self._lock:
+            if self._availability_view is None:
+                rows = self._conn.execute(
+                    "SELECT day, slot FROM reservations"
+                ).fetchall()
+                taken = set(rows)
+                self._availability_view = {
+                    d: [i for i in range(CAPACITY) if (d, i) not in taken]
+                    for d in DAYS
+                }
+            return {d: list(v) for d, v in self._availability_view.items()}
+
+    # --------------------------------------------
+    # async API
+    # --------------------------------------------
+    async def load(self):
+        return await asyncio.to_thread(self._load)
+
+    @timed(STORAGE_SECONDS, op="reserve")
+    async def reserve(self, day, slot, full_name, telegram_id):
+        result, previous = await asyncio.to_thread(
+            self._reserve, day, slot, full_name, telegram_id
+        )
+        self._reset_done(previous)
+        return result
+
+    @timed(STORAGE_SECONDS, op="cancel_reservation")
+    async def cancel(self, telegram_id, day=None, slot=None):
+        return await asyncio.to_thread(self._cancel, telegram_id, day, slot)
+
+    async def user_reservations(self, telegram_id):
+        return await asyncio.to_thread(self._user_reservations, telegram_id)
+
+    async def reset_week(self):
+        return self._reset_done(await asyncio.to_thread(self._reset))
+
+    async def reset_if_due(self):
+        return self._reset_done(await asyncio.to_thread(self._reset_if_due))
+
+    def _reset_done(self, previous):
+        if previous is None:
+            return False
+        self._fire(self.on_reset, previous)
+        return True
+
+    async def availability(self):
+        # نمای آماده بدون رفتن به thread برگردانده می‌شود
+        if self._availability_view is not None:
+            return self._availability()
+        return await asyncio.to_thread(self._availability)
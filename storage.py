@@ -0,0 +1,96 @@
+import os
+import asyncio
+from abc import ABC, abstractmethod
+
+# ============================================================
+#  STORAGE INTERFACE
+# ============================================================
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "jsonbin").lower()
+
+
+class StorageUnavailable(RuntimeError):
+    """The backend could not be reached in time; the caller may retry later."""
+
+
+# ارجاع به task هوک‌ها تا پیش از پایان جمع‌آوری نشوند
+_hook_tasks = set()
+
+
+class Storage(ABC):
+    """
+    Reservation storage backend.
+
+    All methods are coroutines so handlers on tg_loop can await them.
+    reserve/cancel return (ok, message) with the user-facing text.
+
+    Hooks are async callables set by the owner (main.py):
+    on_lost(telegram_id, day, slot) runs when a confirmed booking lost
+    its cell to a concurrent write elsewhere.
+    on_reset(previous_week) runs after every weekly reset that happened,
+    whichever call (scheduler, reserve, admin) performed it.
+    """
+
+    on_lost = None
+    on_reset = None
+
+    def _fire(self, hook, *args):
+        """Run an async hook in the background on the running loop; errors are logged."""
+        if hook is None:
+            return
+
+        async def run():
+            try:
+                await hook(*args)
+            except Exception as e:
+                print("❌ Storage hook error:", e)
+
+        task = asyncio.get_running_loop().create_task(run())
+        _hook_tasks.add(task)
+        task.add_done_callback(_hook_tasks.discard)
+
+    @abstractmethod
+    async def load(self):
+        """Return the whole week as a JSONBin-shaped document."""
+
+    @abstractmethod
+    async def reserve(self, day, slot, full_name, telegram_id):
+        """Book (day, slot) for telegram_id unless it is already taken."""
+
+    @abstractmethod
+    async def cancel(self, telegram_id, day=None, slot=None):
+        """Remove this user's reservation at (day, slot), or ALL of them."""
+
+    @abstractmethod
+    async def user_reservations(self, telegram_id):
+        """Return [(day, slot), ...] held by this user, in week order."""
+
+    @abstractmethod
+    async def reset_week(self):
+        """Clear every reservation and stamp last_reset with today."""
+
+    @abstractmethod
+    async def reset_if_due(self):
+        """Reset the week if it's Friday and not yet reset. Returns True if reset."""
+
+    @abstractmethod
+    async def availability(self):
+        """Return {day: [free slot indexes]}, served from memory when possible."""
+
+    async def close(self):
+        """Release connections on shutdown."""
+
+
+def get_storage(backend=None):
+    """Build the backend selected by STORAGE_BACKEND (jsonbin | sqlite)."""
+    backend = (backend or STORAGE_BACKEND).lower()
+
+    # importها تنبل هستند تا بک‌اند انتخاب‌نشده به ENV خودش نیاز نداشته باشد
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage()
+
+    if backend == "jsonbin":
+        from jsonbin import JsonBinStorage
+        return JsonBinStorage()
+
+    raise RuntimeError(f"❌ Unknown STORAGE_BACKEND: {backend}")